@@ -16,6 +16,7 @@ from src.contracts.project_factory_listeners import (
 )
 from src.contracts.project_listeners import project_execution_loop
 from src.ai.placement.init import init_grid_arrays
+from src.ai.placement.placement_pool import shutdown_placement_pool
 from src.contracts.provider import provider_connect
 
 
@@ -44,3 +45,8 @@ async def startup_event():
     asyncio.create_task(listen_to_pixels_events_loop())
     await asyncio.sleep(1)
     asyncio.create_task(project_execution_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_placement_pool()
@@ -0,0 +1,339 @@
+from typing import Callable, Tuple
+import numpy as np
+
+from src.core.config import config
+
+# called after every pixel change with (row, col, old_color, old_owner, old_stake),
+# old_color being a palette id
+GridListener = Callable[[int, int, int, int, float], None]
+
+GWEI = 10**9
+# largest gwei limb stored in int64, larger stakes are kept in stake_overflow
+MAX_STAKE_GWEI = 2**62
+
+
+def distinct_colors(ids: np.ndarray) -> np.ndarray:
+    # sorted distinct palette ids, counting beats sorting for small ids
+    return np.flatnonzero(np.bincount(ids.ravel()))
+
+
+# (row0, col0, row1, col1), bounds included
+BoundingBox = Tuple[int, int, int, int]
+
+
+class OwnerAggregates:
+    """
+    Pixel count, exact stake in wei and bounding box of the pixels of every
+    owner id, updated in O(1) per pixel change. A box losing a pixel on its
+    border is only marked stale, and recomputed within its old bounds when
+    read.
+    """
+
+    def __init__(self, grid: "GridState"):
+        self.grid = grid
+        self.counts: dict[int, int] = {}
+        self.stakes: dict[int, int] = {}
+        self.boxes: dict[int, BoundingBox] = {}
+        self.stale: set[int] = set()
+        self.rebuild()
+
+    def copy(self, grid: "GridState") -> "OwnerAggregates":
+        aggregates = OwnerAggregates.__new__(OwnerAggregates)
+        aggregates.grid = grid
+        aggregates.counts = dict(self.counts)
+        aggregates.stakes = dict(self.stakes)
+        aggregates.boxes = dict(self.boxes)
+        aggregates.stale = set(self.stale)
+        return aggregates
+
+    def rebuild(self):
+        # from a full scan of the grid, after its arrays were set directly
+        owner = self.grid.owner.ravel()
+        order = np.argsort(owner, kind="stable")
+        owners, starts, counts = np.unique(
+            owner[order], return_index=True, return_counts=True
+        )
+        rows, cols = np.divmod(order, self.grid.width)
+        gwei = self.grid.stake_gwei.ravel()[order]
+        # summed in two halves so that the int64 sums cannot overflow
+        gwei_high = np.add.reduceat(gwei >> 31, starts)
+        gwei_low = np.add.reduceat(gwei & (2**31 - 1), starts)
+        rem = np.add.reduceat(self.grid.stake_rem.ravel()[order], starts)
+        self.counts = {int(o): int(n) for o, n in zip(owners, counts)}
+        self.stakes = {
+            int(o): ((int(high) << 31) + int(low)) * GWEI + int(r)
+            for o, high, low, r in zip(owners, gwei_high, gwei_low, rem)
+        }
+        for (row, col), stake in self.grid.stake_overflow.items():
+            self.stakes[int(self.grid.owner[row, col])] += stake - MAX_STAKE_GWEI * GWEI
+        self.boxes = {
+            int(o): (int(r0), int(c0), int(r1), int(c1))
+            for o, r0, c0, r1, c1 in zip(
+                owners,
+                np.minimum.reduceat(rows, starts),
+                np.minimum.reduceat(cols, starts),
+                np.maximum.reduceat(rows, starts),
+                np.maximum.reduceat(cols, starts),
+            )
+        }
+        self.stale = set()
+
+    def move(
+        self, row: int, col: int, old_owner: int, old_wei: int, owner: int, wei: int
+    ):
+        self.stakes[old_owner] -= old_wei
+        self.stakes[owner] = self.stakes.get(owner, 0) + wei
+        if owner == old_owner:
+            return
+        self.counts[old_owner] -= 1
+        if self.counts[old_owner] == 0:
+            del self.counts[old_owner], self.stakes[old_owner], self.boxes[old_owner]
+            self.stale.discard(old_owner)
+        else:
+            row0, col0, row1, col1 = self.boxes[old_owner]
+            if row in (row0, row1) or col in (col0, col1):
+                self.stale.add(old_owner)
+        self.counts[owner] = self.counts.get(owner, 0) + 1
+        box = self.boxes.get(owner)
+        if box is None:
+            self.boxes[owner] = (row, col, row, col)
+        else:
+            self.boxes[owner] = (
+                min(box[0], row),
+                min(box[1], col),
+                max(box[2], row),
+                max(box[3], col),
+            )
+
+    def box(self, owner: int) -> BoundingBox | None:
+        box = self.boxes.get(owner)
+        if box is not None and owner in self.stale:
+            row0, col0, row1, col1 = box
+            rows, cols = np.nonzero(
+                self.grid.owner[row0 : row1 + 1, col0 : col1 + 1] == owner
+            )
+            box = (
+                row0 + int(rows.min()),
+                col0 + int(cols.min()),
+                row0 + int(rows.max()),
+                col0 + int(cols.max()),
+            )
+            self.boxes[owner] = box
+            self.stale.discard(owner)
+        return box
+
+
+class GridState:
+    """
+    The canvas as seen by the placement engines: colour, owner and stake per
+    pixel, the positional weights, the id <-> (row, col) mapping and a version
+    counter bumped on every pixel change.
+
+    Colours are stored as ids into an append-only palette, in the smallest
+    unsigned dtype that fits the palette. Images must be converted with
+    intern_colors before being compared with the grid.
+
+    stake is the float ether view of (stake + 1 wei) used by the vectorized
+    engines. The exact stake in wei is split in int64 limbs, stake_gwei and
+    stake_rem (the wei below one gwei), with the rare stakes past
+    MAX_STAKE_GWEI held exactly in stake_overflow.
+
+    owners keeps the pixel count, stake and bounding box of every owner, to
+    be rebuilt with owners.rebuild() if the arrays are written directly.
+
+    Writers stage pixel changes with stage_pixel and apply them all at once
+    with publish, e.g. one block of events, so that no reader sees half of a
+    batch. pin returns an immutable view of the grid at its current version
+    that shares the arrays, the next write copies them first.
+    """
+
+    def __init__(self, height: int, width: int):
+        self.height = height
+        self.width = width
+        self.color: np.ndarray = np.zeros((height, width), dtype=np.uint8)
+        self.owner: np.ndarray = np.zeros((height, width), dtype=np.uint32)
+        self.stake: np.ndarray = np.full((height, width), 1e-18, dtype=np.float64)
+        self.stake_gwei: np.ndarray = np.zeros((height, width), dtype=np.int64)
+        self.stake_rem: np.ndarray = np.zeros((height, width), dtype=np.int64)
+        self.stake_overflow: dict[Tuple[int, int], int] = {}
+        self.weights: np.ndarray = np.ones((height, width), dtype=np.float32)
+        self.version = 0
+        self.listeners: list[GridListener] = []
+        # colour -> palette id and back, colour 0 is the empty pixel
+        self.palette: dict[int, int] = {0: 0}
+        self.palette_colors: list[int] = [0]
+        self.owners = OwnerAggregates(self)
+        # (row, col, color, owner, stake_wei) waiting for publish
+        self.staged: list[Tuple[int, int, int, int, int]] = []
+        # whether the arrays are shared with a pinned view
+        self.pinned = False
+
+    @classmethod
+    def from_arrays(
+        cls, color: np.ndarray, owner: np.ndarray, stake: np.ndarray
+    ) -> "GridState":
+        # wraps existing arrays without copying, e.g. a shared memory snapshot,
+        # color holds palette ids and the palette itself is not carried over.
+        # The wei limbs are rebuilt from the float stake, exact up to its
+        # precision only.
+        grid = cls.__new__(cls)
+        grid.height, grid.width = color.shape
+        grid.color = color
+        grid.owner = owner
+        grid.stake = stake
+        wei = np.maximum(stake * 1e18 - 1, 0.0)
+        grid.stake_gwei = np.minimum(wei // GWEI, MAX_STAKE_GWEI).astype(np.int64)
+        grid.stake_rem = np.round(wei - grid.stake_gwei * float(GWEI)).astype(np.int64)
+        grid.stake_rem = np.clip(grid.stake_rem, 0, GWEI - 1)
+        grid.stake_overflow = {}
+        grid.weights = np.ones(color.shape, dtype=np.float32)
+        grid.version = 0
+        grid.listeners = []
+        grid.palette = {}
+        grid.palette_colors = []
+        grid.owners = OwnerAggregates(grid)
+        grid.staged = []
+        grid.pinned = False
+        return grid
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    def coords_to_id(self, *, row: int, col: int) -> int:
+        return row * self.width + col
+
+    def id_to_coords(self, id: int) -> Tuple[int, int]:
+        row, col = divmod(id, self.width)
+        return row, col  # WARNING the x represent the col and y represent the row
+
+    def intern_color(self, color: int) -> int:
+        id = self.palette.get(color)
+        if id is None:
+            id = len(self.palette_colors)
+            self.palette[color] = id
+            self.palette_colors.append(color)
+            if id > np.iinfo(self.color.dtype).max:
+                self.color = self.color.astype(np.min_scalar_type(id))
+        return id
+
+    def intern_colors(self, colors: np.ndarray) -> np.ndarray:
+        # palette ids of an array of colours, unknown colours are added
+        unique, inverse = np.unique(colors, return_inverse=True)
+        ids = [self.intern_color(int(color)) for color in unique]
+        return np.array(ids, dtype=self.color.dtype)[inverse].reshape(colors.shape)
+
+    def decode_colors(self, ids: np.ndarray) -> np.ndarray:
+        return np.array(self.palette_colors, dtype=np.uint32)[ids]
+
+    def add_listener(self, listener: GridListener):
+        self.listeners.append(listener)
+
+    def pin(self) -> "GridState":
+        # O(owners), the arrays are copied by the next write only
+        view = GridState.__new__(GridState)
+        view.height, view.width = self.height, self.width
+        for name in ("color", "owner", "stake", "stake_gwei", "stake_rem"):
+            array = getattr(self, name).view()
+            array.setflags(write=False)
+            setattr(view, name, array)
+        view.stake_overflow = dict(self.stake_overflow)
+        # only set once at startup
+        view.weights = self.weights
+        view.version = self.version
+        view.listeners = []
+        # append-only, ids stay valid
+        view.palette = self.palette
+        view.palette_colors = self.palette_colors
+        view.owners = self.owners.copy(view)
+        view.staged = []
+        view.pinned = False
+        self.pinned = True
+        return view
+
+    def _unpin(self):
+        for name in ("color", "owner", "stake", "stake_gwei", "stake_rem"):
+            setattr(self, name, getattr(self, name).copy())
+        self.pinned = False
+
+    def stage_pixel(self, row: int, col: int, color: int, owner: int, stake_wei: int):
+        self.staged.append((row, col, color, owner, stake_wei))
+
+    def publish(self):
+        # applies the staged changes in order, without yielding in between
+        staged, self.staged = self.staged, []
+        for row, col, color, owner, stake_wei in staged:
+            self.set_pixel(row, col, color, owner, stake_wei)
+
+    def set_pixel(self, row: int, col: int, color: int, owner: int, stake_wei: int):
+        if self.pinned:
+            self._unpin()
+        old_color = int(self.color[row, col])
+        old_owner = int(self.owner[row, col])
+        old_stake = float(self.stake[row, col])
+        old_wei = self.stake_overflow.get(
+            (row, col),
+            int(self.stake_gwei[row, col]) * GWEI + int(self.stake_rem[row, col]),
+        )
+        self.color[row, col] = self.intern_color(color)
+        self.owner[row, col] = owner
+        self.stake[row, col] = (stake_wei + 1) / 10**18
+        gwei, rem = divmod(stake_wei, GWEI)
+        if gwei > MAX_STAKE_GWEI:
+            self.stake_overflow[(row, col)] = stake_wei
+            gwei, rem = MAX_STAKE_GWEI, 0
+        else:
+            self.stake_overflow.pop((row, col), None)
+        self.stake_gwei[row, col] = gwei
+        self.stake_rem[row, col] = rem
+        self.owners.move(row, col, old_owner, old_wei, owner, stake_wei)
+        self.version += 1
+        for listener in self.listeners:
+            listener(row, col, old_color, old_owner, old_stake)
+
+    def stake_wei(self, rows: np.ndarray, cols: np.ndarray) -> int:
+        # exact sum of the stakes of the given pixels in wei, the gwei limbs
+        # are summed in two halves so that the int64 sums cannot overflow
+        gwei = self.stake_gwei[rows, cols]
+        total_gwei = (int(np.sum(gwei >> 31)) << 31) + int(np.sum(gwei & (2**31 - 1)))
+        total = total_gwei * GWEI + int(np.sum(self.stake_rem[rows, cols]))
+        for i in np.flatnonzero(gwei == MAX_STAKE_GWEI):
+            overflow = self.stake_overflow.get((int(rows[i]), int(cols[i])))
+            if overflow is not None:
+                total += overflow - MAX_STAKE_GWEI * GWEI
+        return total
+
+    def outbid_amounts(
+        self, rows: np.ndarray, cols: np.ndarray, extra_wei: int = 0
+    ) -> np.ndarray:
+        """
+        Smallest amounts taking the given pixels (stake + 1 wei) plus
+        extra_wei, exact, as [gwei, wei below one gwei] limbs of shape (n, 2).
+        The limbs are int64 unless a pixel is in stake_overflow.
+        """
+        extra_gwei, extra_rem = divmod(extra_wei + 1, GWEI)
+        gwei = self.stake_gwei[rows, cols]
+        rem = self.stake_rem[rows, cols] + extra_rem
+        amounts = np.stack([gwei + extra_gwei + rem // GWEI, rem % GWEI], axis=1)
+        if len(self.stake_overflow) > 0:
+            for i in np.flatnonzero(gwei == MAX_STAKE_GWEI):
+                stake = self.stake_overflow.get((int(rows[i]), int(cols[i])))
+                if stake is not None:
+                    amounts = amounts.astype(object)
+                    amounts[i] = divmod(stake + extra_wei + 1, GWEI)
+        return amounts
+
+    def staked_by_owner(self, owner: int) -> float:
+        return self.owners.stakes.get(owner, 0) / 10**18
+
+    def owner_pixel_count(self, owner: int) -> int:
+        return self.owners.counts.get(owner, 0)
+
+    def owner_stake_wei(self, owner: int) -> int:
+        return self.owners.stakes.get(owner, 0)
+
+    def owner_bounding_box(self, owner: int) -> BoundingBox | None:
+        return self.owners.box(owner)
+
+
+GRID = GridState(config.GRID_H, config.GRID_W)
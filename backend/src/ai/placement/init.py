@@ -3,6 +3,7 @@ from typing import Tuple
 import numpy as np
 from PIL import Image
 import asyncio
+from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from src.models.pixamut.pixel.pixel_crud import (
     PIXELS,
@@ -11,31 +12,24 @@ from src.models.pixamut.pixel.pixel_crud import (
     PixelBase,
 )
 from src.models.session import async_session
-from src.ai.utils import hash_address
+from src.models.key_value.key_value_crud import KEYVALUE
+from src.ai.utils import OWNERS, owner_id
 from src.contracts.provider import pixel_staking_contract
+from src.ai.placement.grid_state import GRID
+from src.ai.placement.placement_budget import clear_weight_maps
+from src.ai.placement.placement_churn import CHURN
 
-GRID_H = 100
-GRID_W = 100
 
-grid_color: np.ndarray = np.zeros((GRID_H, GRID_W), dtype=np.uint32)
-grid_owner: np.ndarray = np.zeros((GRID_H, GRID_W), dtype=np.uint32)
-grid_stake: np.ndarray = np.full((GRID_H, GRID_W), 1e-18, dtype=np.float64)
-grid_weights: np.ndarray = np.ones((GRID_H, GRID_W), dtype=np.float32)
+def get_staked_by_owner_in_eth(owner_address: str) -> float:
+    return GRID.staked_by_owner(owner_id(owner_address))
 
 
-def get_staked_by_owner_in_eth(owner_address: str) -> int:
-    owner = hash_address(owner_address)
-    return np.sum(grid_stake[grid_owner == owner])
-
-
-def coords_to_id(*, row: int, col: int):
-    return row * GRID_W + col
+def coords_to_id(*, row: int, col: int) -> int:
+    return GRID.coords_to_id(row=row, col=col)
 
 
 def id_to_coords(id: int) -> Tuple[int, int]:
-    col = id % GRID_W
-    row = id // GRID_H
-    return row, col  # WARNING the x represent the col and y represent the row
+    return GRID.id_to_coords(id)
 
 
 def wei_to_ether(amount: int) -> float:
@@ -47,30 +41,64 @@ def ether_to_wei(amount: Decimal | float) -> int:
 
 
 def update_grid(pixel: PixelBase | PixelModel):
-    global grid_color, grid_owner, grid_stake
     row, col = id_to_coords(pixel.id)
-    grid_color[row, col] = pixel.color
-    grid_owner[row, col] = hash_address(pixel.owner.lower())
-    grid_stake[row, col] = wei_to_ether(pixel.stake_amount + 1)
+    GRID.set_pixel(
+        row,
+        col,
+        color=pixel.color,
+        owner=owner_id(pixel.owner),
+        stake_wei=int(pixel.stake_amount),
+    )
+
+
+OWNER_KEY_PREFIX = "owner:"
+
+
+async def load_owners(db: AsyncSession):
+    # owner ids stay the same across restarts
+    entries = await KEYVALUE.get_by_prefix(db, prefix=OWNER_KEY_PREFIX)
+    OWNERS.load(
+        [(int(entry.key[len(OWNER_KEY_PREFIX) :]), entry.value) for entry in entries]
+    )
+
+
+async def save_owners(db: AsyncSession):
+    while len(OWNERS.unsaved) > 0:
+        id = OWNERS.unsaved[0]
+        await KEYVALUE.set(
+            db, key=f"{OWNER_KEY_PREFIX}{id}", value=str(OWNERS.address(id))
+        )
+        OWNERS.unsaved.pop(0)
+
+
+def stage_grid_update(pixel: PixelBase | PixelModel):
+    # applied with the rest of its block by GRID.publish
+    row, col = id_to_coords(pixel.id)
+    GRID.stage_pixel(
+        row,
+        col,
+        color=pixel.color,
+        owner=owner_id(pixel.owner),
+        stake_wei=int(pixel.stake_amount),
+    )
 
 
 def compute_global_weights():
-    global grid_weights
-    H, W = grid_weights.shape
+    H, W = GRID.shape
     center_row, center_col = (H - 1) / 2.0, (W - 1) / 2.0
-    y, x = np.indices(grid_weights.shape)
+    y, x = np.indices(GRID.shape)
     d = np.sqrt((y - center_row) ** 2 + (x - center_col) ** 2)
-    grid_weights += 1.0 / (1.0 + d)
+    GRID.weights[...] = 1.0 + 1.0 / (1.0 + d)
 
-    grid_weights /= grid_weights.sum()
+    GRID.weights /= GRID.weights.sum()
+    clear_weight_maps()
 
 
 async def init_grid_arrays():
-    global grid_color, grid_owner, grid_stake
-    # compute_global_weights()
+    compute_global_weights()
 
     async with async_session() as db:
-        # for i in range(GRID_H * GRID_W):
+        # for i in range(GRID.height * GRID.width):
         #     pixel_data = await pixel_staking_contract.functions.pixels(i).call()  # type: ignore
         #     pixel = PixelCreate(
         #         id=i,
@@ -83,6 +111,10 @@ async def init_grid_arrays():
         #         obj_in=pixel,
         #     )
         #     update_grid(pixel)
+        await load_owners(db)
         pixels = await PIXELS.get_many(db)
         for pixel in pixels:
             update_grid(pixel)
+        await save_owners(db)
+    # the changes from here on are events
+    CHURN.start()
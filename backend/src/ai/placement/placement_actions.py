@@ -1,11 +1,39 @@
+from typing import NamedTuple
 import numpy as np
 
-from src.ai.utils import hash_address
-from src.ai.placement.init import coords_to_id, grid_stake, grid_owner, grid_color
+from src.core.config import config
+from src.ai.utils import owner_id
+from src.ai.placement.grid_state import GRID, GWEI, GridState
 from src.models.pixamut.action.action_crud import ActionCall, ActionCreate, ActionMethod
-from src.ai.placement.placement_budget import (
-    compute_allocation_of_remaining_budget,
-)
+from src.ai.placement.placement_topup import pixel_risk, water_fill
+
+STAKE_BATCH_SIZE = 20
+CHANGE_BATCH_SIZE = 20
+
+
+class ActionBatch(NamedTuple):
+    method: ActionMethod
+    pixel_ids: np.ndarray
+    colors: np.ndarray
+    # [gwei, wei] limbs per pixel, see GridState.outbid_amounts
+    amounts: np.ndarray | None = None
+
+    def to_action(self, *, project_address: str, idx: int) -> ActionCreate:
+        return ActionCreate(
+            address=project_address,
+            idx=idx,
+            call=ActionCall(
+                method=self.method,
+                pixelIds=self.pixel_ids.tolist(),
+                amounts=(
+                    None
+                    if self.amounts is None
+                    else [int(gwei) * GWEI + int(rem) for gwei, rem in self.amounts]
+                ),
+                colors=self.colors.tolist(),
+            ),
+            hash="pending",
+        )
 
 
 def generate_actions_for_placement(
@@ -16,92 +44,124 @@ def generate_actions_for_placement(
     base_row: int,
     base_col: int,
     project_address: str,
-    unused_budget: float
-) -> list[ActionCreate]:
-    project_id = hash_address(project_address)
-    H, W = grid_color.shape
+    unused_budget: float,
+    grid: GridState = GRID,
+) -> list[ActionBatch]:
+    project_id = owner_id(project_address)
+    H, W = grid.shape
     h, w = image_grid.shape
 
     if base_row < 0 or base_col < 0 or base_col + w > W or base_row + h > H:
         raise ValueError("Image placement out of grid bounds")
 
-    sub_color = grid_color[base_row : base_row + h, base_col : base_col + w]
-    sub_owner = grid_owner[base_row : base_row + h, base_col : base_col + w]
-    sub_stake = grid_stake[base_row : base_row + h, base_col : base_col + w]
+    sub_color = grid.color[base_row : base_row + h, base_col : base_col + w]
+    sub_owner = grid.owner[base_row : base_row + h, base_col : base_col + w]
 
     color_diff_mask = (sub_color != image_grid) & image_mask
     same_owner_mask = sub_owner == project_id
     stake_mask = color_diff_mask & ~same_owner_mask
     change_mask = color_diff_mask & same_owner_mask
 
-    stake_coords = np.argwhere(stake_mask)
-
-    # distribute any extra budget only to active pixels
-    allocation = 0
-    if unused_budget > 1 and len(stake_coords) > 0:
-        allocation = unused_budget / len(stake_coords)
-
-    stake_list = []
-    for row, col in stake_coords:
-        stake_amount = sub_stake[row, col] + allocation
-        new_color = int(image_grid[row, col])
-        stake_list.append(
-            {
-                "id": coords_to_id(row=base_row + row, col=base_col + col),
-                "color": new_color,
-                "amount": stake_amount * 1e18,
-            }
-        )
+    # image_grid holds palette ids, the batches carry the actual colours.
+    # pixel ids, colours and amounts stay numpy arrays until the transaction
+    # for a batch is built, see ActionBatch.to_action
+    stake_rows, stake_cols = np.nonzero(stake_mask)
+    stake_ids = grid.coords_to_id(row=base_row + stake_rows, col=base_col + stake_cols)
+    stake_amounts = grid.outbid_amounts(base_row + stake_rows, base_col + stake_cols)
+    stake_colors = grid.decode_colors(image_grid[stake_rows, stake_cols])
 
-    change_coords = np.argwhere(change_mask)
-    change_list = []
-    for row, col in change_coords:
-        new_color = int(image_grid[row, col])
-        change_list.append(
-            {
-                "id": coords_to_id(row=base_row + row, col=base_col + col),
-                "color": new_color,
-            }
-        )
+    # active pixels already held with the right colour, re-staked higher when
+    # they are at risk of being outbid
+    held_rows, held_cols = np.nonzero(image_mask & same_owner_mask & ~color_diff_mask)
+    held_rows, held_cols = base_row + held_rows, base_col + held_cols
 
-    actions: list[ActionCreate] = []
-    idx: int = 0
-    stake_batch_size: int = 20
-    change_batch_size: int = 20
-
-    def chunkify(lst, n):
-        for i in range(0, len(lst), n):
-            yield lst[i : i + n]
-
-    for chunk in chunkify(stake_list, stake_batch_size):
-        actions.append(
-            ActionCreate(
-                address=project_address,
-                idx=idx,
-                call=ActionCall(
-                    method=ActionMethod.stakePixels,
-                    pixelIds=[c["id"] for c in chunk],
-                    amounts=[c["amount"] for c in chunk],
-                    colors=[c["color"] for c in chunk],
-                ),
-                hash="pending",
+    # the extra budget goes to the pixels most at risk. a re-stake transfers
+    # the whole amount in before the previous stake is refunded, so the held
+    # pixels only share it when their stake can be fronted too, all of them
+    # in a single top-up batch
+    stake_extra = np.zeros(len(stake_rows), dtype=np.int64)
+    held_extra = np.zeros(len(held_rows), dtype=np.int64)
+    if unused_budget > 1 and len(stake_rows) + len(held_rows) > 0:
+        rows = np.concatenate([base_row + stake_rows, held_rows])
+        cols = np.concatenate([base_col + stake_cols, held_cols])
+        stakes = grid.stake[rows, cols]
+        risks = pixel_risk(rows, cols, project_id, stakes, grid=grid)
+        share = water_fill(stakes, risks, unused_budget)[len(stake_rows) :]
+        candidates = np.flatnonzero(share >= config.PLACEMENT_TOPUP_MIN)
+        candidates = candidates[np.argsort(-share[candidates], kind="stable")]
+        candidates = len(stake_rows) + candidates[:STAKE_BATCH_SIZE]
+        # the largest shares whose stakes fit in the budget next to them, one
+        # more gwei per pixel for the rounding of the amounts
+        needed = np.cumsum(stakes[candidates] + share[candidates - len(stake_rows)])
+        candidates = candidates[: int(np.sum(needed <= unused_budget))]
+        fronted = float(np.sum(stakes[candidates])) + len(candidates) / GWEI
+        kept = np.concatenate([np.arange(len(stake_rows)), candidates])
+        extra = np.zeros(len(rows), dtype=np.float64)
+        extra[kept] = water_fill(stakes[kept], risks[kept], unused_budget - fronted)
+        extra_gwei = np.floor(extra * GWEI).astype(np.int64)
+        stake_extra, held_extra = np.split(extra_gwei, [len(stake_rows)])
+    stake_amounts[:, 0] += stake_extra
+
+    # re-staking a pixel costs a transaction, small top-ups are not worth it,
+    # the largest ones come first
+    topped = np.flatnonzero(held_extra >= config.PLACEMENT_TOPUP_MIN * GWEI)
+    topped = topped[np.argsort(-held_extra[topped], kind="stable")]
+    topup_rows, topup_cols = held_rows[topped], held_cols[topped]
+    topup_extra = held_extra[topped]
+    topup_amounts = grid.outbid_amounts(topup_rows, topup_cols)
+    topup_amounts[:, 0] += topup_extra
+    topup_ids = grid.coords_to_id(row=topup_rows, col=topup_cols)
+    topup_colors = grid.decode_colors(grid.color[topup_rows, topup_cols])
+
+    change_rows, change_cols = np.nonzero(change_mask)
+    change_ids = grid.coords_to_id(
+        row=base_row + change_rows, col=base_col + change_cols
+    )
+    change_colors = grid.decode_colors(image_grid[change_rows, change_cols])
+
+    batches: list[ActionBatch] = []
+    for start in range(0, len(stake_ids), STAKE_BATCH_SIZE):
+        end = start + STAKE_BATCH_SIZE
+        batches.append(
+            ActionBatch(
+                method=ActionMethod.stakePixels,
+                pixel_ids=stake_ids[start:end],
+                colors=stake_colors[start:end],
+                amounts=stake_amounts[start:end],
             )
         )
-        idx += 1
-
-    for chunk in chunkify(change_list, change_batch_size):
-        actions.append(
-            ActionCreate(
-                address=project_address,
-                idx=idx,
-                call=ActionCall(
-                    method=ActionMethod.changeColors,
-                    pixelIds=[c["id"] for c in chunk],
-                    colors=[c["color"] for c in chunk],
-                ),
-                hash="pending",
+    for start in range(0, len(change_ids), CHANGE_BATCH_SIZE):
+        end = start + CHANGE_BATCH_SIZE
+        batches.append(
+            ActionBatch(
+                method=ActionMethod.changeColors,
+                pixel_ids=change_ids[start:end],
+                colors=change_colors[start:end],
             )
         )
-        idx += 1
-
-    return actions
+    # a re-stake transfers the whole amount in before the previous stake is
+    # refunded, each top-up batch must fit in what is left of the budget
+    liquidity = int(unused_budget * GWEI) - int(np.sum(stake_extra))
+    batch: list[int] = []
+    batch_gwei = 0
+    for i in range(len(topup_ids) + 1):
+        needed = int(topup_amounts[i, 0]) + 1 if i < len(topup_ids) else None
+        if len(batch) > 0 and (
+            needed is None
+            or len(batch) == STAKE_BATCH_SIZE
+            or batch_gwei + needed > liquidity
+        ):
+            batches.append(
+                ActionBatch(
+                    method=ActionMethod.stakePixels,
+                    pixel_ids=topup_ids[batch],
+                    colors=topup_colors[batch],
+                    amounts=topup_amounts[batch],
+                )
+            )
+            liquidity -= int(np.sum(topup_extra[batch]))
+            batch, batch_gwei = [], 0
+        if needed is not None and needed <= liquidity:
+            batch.append(i)
+            batch_gwei += needed
+    return batches
@@ -0,0 +1,113 @@
+from typing import Iterator, Tuple
+import time
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_sparse import compute_costs_at_offsets
+
+# gathered elements priced between two deadline checks
+ANYTIME_CHUNK_ELEMENTS = 1 << 18
+
+
+def offset_ring(
+    out_h: int, out_w: int, row: int, col: int, distance: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    # in bounds offsets at exactly this distance of (row, col), row-major
+    if distance == 0:
+        return np.array([row]), np.array([col])
+    c0, c1 = max(col - distance, 0), min(col + distance, out_w - 1)
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    if row - distance >= 0:
+        rows.append(np.full(c1 - c0 + 1, row - distance))
+        cols.append(np.arange(c0, c1 + 1))
+    middle = np.arange(max(row - distance + 1, 0), min(row + distance, out_h))
+    sides = [c for c in (col - distance, col + distance) if 0 <= c < out_w]
+    if len(sides) > 0 and len(middle) > 0:
+        rows.append(np.repeat(middle, len(sides)))
+        cols.append(np.tile(sides, len(middle)))
+    if row + distance < out_h:
+        rows.append(np.full(c1 - c0 + 1, row + distance))
+        cols.append(np.arange(c0, c1 + 1))
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def offsets_by_distance(
+    out_h: int, out_w: int, hint: Tuple[int, int], chunk: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Every offset in chunks of about chunk offsets, the hint first then rings
+    of growing distance around it. The rings are built as they are consumed,
+    so a search stopped early never pays for the whole grid.
+    """
+    row, col = min(max(hint[0], 0), out_h - 1), min(max(hint[1], 0), out_w - 1)
+    max_distance = max(row, out_h - 1 - row, col, out_w - 1 - col)
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    size = 0
+    for distance in range(max_distance + 1):
+        ring_rows, ring_cols = offset_ring(out_h, out_w, row, col, distance)
+        rows.append(ring_rows)
+        cols.append(ring_cols)
+        size += len(ring_rows)
+        if size >= chunk or distance == max_distance:
+            all_rows, all_cols = np.concatenate(rows), np.concatenate(cols)
+            for start in range(0, size, chunk):
+                yield all_rows[start : start + chunk], all_cols[start : start + chunk]
+            rows, cols, size = [], [], 0
+
+
+def find_best_placement_anytime(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    deadline: float,
+    hint: Tuple[int | None, int | None] | None = None,
+    *,
+    grid: GridState = GRID,
+    chunk_elements: int = ANYTIME_CHUNK_ELEMENTS,
+) -> Tuple[int | None, int | None, float | None]:
+    """
+    Best placement found before deadline (a time.monotonic() value). Offsets
+    are priced exactly, chunk by chunk, starting at hint (typically the last
+    best placement, the grid centre by default) and moving outwards, so an
+    early stop still has looked at the most promising offsets. The result is
+    exact when the whole grid fits in the time given.
+
+    It only reads grid, pass a pinned view (GRID.pin()) to run it in a
+    thread while the grid keeps changing.
+    """
+    H, W = grid.shape
+    h, w = image_color.shape
+    if h > H or w > W:
+        return None, None, None
+
+    out_h, out_w = H - h + 1, W - w + 1
+    if hint is None or hint[0] is None or hint[1] is None:
+        hint = (out_h // 2, out_w // 2)
+    chunk = max(1, chunk_elements // max(1, int(np.count_nonzero(image_mask))))
+    not_owned_stake = np.where(grid.owner != new_owner, grid.stake, 0.0)
+
+    best_row: int | None = None
+    best_col: int | None = None
+    best_cost: float | None = None
+    for i, (rows, cols) in enumerate(offsets_by_distance(out_h, out_w, hint, chunk)):
+        # at least one chunk is priced, whatever the deadline
+        if i > 0 and time.monotonic() >= deadline:
+            break
+        costs = compute_costs_at_offsets(
+            image_color,
+            image_mask,
+            new_owner,
+            rows,
+            cols,
+            grid=grid,
+            not_owned_stake=not_owned_stake,
+        )
+        i = int(np.argmin(costs))
+        if costs[i] <= budget and (best_cost is None or costs[i] < best_cost):
+            best_row, best_col, best_cost = int(rows[i]), int(cols[i]), float(costs[i])
+    return best_row, best_col, best_cost
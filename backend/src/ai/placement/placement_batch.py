@@ -0,0 +1,269 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+import numpy as np
+
+from src.core.config import config
+from src.ai.placement.grid_state import GRID, GridState, distinct_colors
+from src.ai.placement.placement_cost_map import (
+    NBR_COST_TERMS,
+    combine_cost_terms,
+    cost_term_planes,
+    cost_tolerance,
+    exact_placement_cost,
+    select_repriced_placement,
+)
+from src.ai.placement.placement_engine import (
+    PlacementEngine,
+    choose_placement_engine,
+)
+from src.ai.placement.placement_fft import correlate_spectrum
+from src.ai.placement.placement_sparse import compute_cost_terms_sparse
+
+# upper bound on the number of (project, colour) kernel spectra held at once
+MAX_BATCH_PLANES = 256
+
+# (image_color, image_mask, new_owner)
+PlacementRequest = Tuple[np.ndarray, np.ndarray, int]
+
+placement_threads: ThreadPoolExecutor | None = None
+
+
+def get_placement_threads() -> ThreadPoolExecutor:
+    global placement_threads
+    if placement_threads is None:
+        placement_threads = ThreadPoolExecutor(
+            max_workers=config.PLACEMENT_THREADS, thread_name_prefix="placement"
+        )
+    return placement_threads
+
+
+class GridSpectra:
+    """
+    Grid-derived FFT intermediates computed once per sweep and shared by every
+    project: the spectra of the cost term planes of the grid and, lazily, of
+    the planes restricted to each colour.
+    """
+
+    def __init__(self, grid: GridState = GRID):
+        self.grid = grid
+        self.shape: Tuple[int, int] = grid.shape
+        self.colors = distinct_colors(grid.color)
+        self.planes = cost_term_planes(grid, np.ones(grid.shape, dtype=bool))
+        self.term_spectra = np.fft.rfft2(self.planes)
+        self.tolerance = cost_tolerance(grid)
+        self._color_spectra: dict[int, np.ndarray] = {}
+
+    def color_spectra(self, colors: np.ndarray) -> np.ndarray:
+        missing = [int(c) for c in colors if int(c) not in self._color_spectra]
+        # transformed MAX_BATCH_PLANES planes at a time
+        step = max(1, MAX_BATCH_PLANES // NBR_COST_TERMS)
+        for start in range(0, len(missing), step):
+            chunk = missing[start : start + step]
+            planes = np.where(
+                self.grid.color[None, None, :, :]
+                == np.array(chunk)[:, None, None, None],
+                self.planes[None],
+                0.0,
+            )
+            for c, spectrum in zip(chunk, np.fft.rfft2(planes)):
+                self._color_spectra[c] = spectrum
+        return np.stack([self._color_spectra[int(c)] for c in colors])
+
+
+def _subtract_matching_colors(
+    spectrum: np.ndarray,
+    grid_spectra: np.ndarray,
+    image_colors: np.ndarray,
+    image_masks: np.ndarray,
+    colors: np.ndarray,
+    shape: Tuple[int, int],
+):
+    # spectrum (P, T, H, W // 2 + 1) -= sum over c of grid_spectra[c] * kernel[p, c]
+    step = max(1, MAX_BATCH_PLANES // len(image_masks))
+    for start in range(0, len(colors), step):
+        planes = (
+            image_colors[:, None, :, :]
+            == colors[None, start : start + step, None, None]
+        ) & image_masks[:, None, :, :]
+        kernels = correlate_spectrum(planes.astype(np.float64), shape)
+        spectrum -= np.einsum(
+            "ctyx,pcyx->ptyx", grid_spectra[start : start + step], kernels
+        )
+
+
+def _group_cost_terms(
+    requests: list[PlacementRequest], spectra: GridSpectra
+) -> np.ndarray:
+    # cost terms of projects sharing an image shape, stacked
+    H, W = spectra.shape
+    h, w = requests[0][0].shape
+    image_colors = np.stack([image_color for image_color, _, _ in requests])
+    image_masks = np.stack([image_mask.astype(bool) for _, image_mask, _ in requests])
+
+    # stake of every pixel, owned or not, is handled for the whole batch
+    spectrum = (
+        spectra.term_spectra[None]
+        * correlate_spectrum(image_masks.astype(np.float64), (H, W))[:, None]
+    )
+    colors = np.intersect1d(distinct_colors(image_colors[image_masks]), spectra.colors)
+    _subtract_matching_colors(
+        spectrum,
+        spectra.color_spectra(colors),
+        image_colors,
+        image_masks,
+        colors,
+        (H, W),
+    )
+
+    # then each project drops the contribution of the pixels it already owns
+    for p, (_, _, new_owner) in enumerate(requests):
+        owned = spectra.grid.owner == new_owner
+        if not owned.any():
+            continue
+        owned_planes = cost_term_planes(spectra.grid, owned)
+        spectrum[p] -= np.fft.rfft2(owned_planes) * correlate_spectrum(
+            image_masks[p].astype(np.float64), (H, W)
+        )
+        owned_colors = np.intersect1d(
+            distinct_colors(image_colors[p][image_masks[p]]),
+            distinct_colors(spectra.grid.color[owned]),
+        )
+        if len(owned_colors) > 0:
+            owned_color_planes = np.where(
+                spectra.grid.color[None, None, :, :]
+                == owned_colors[:, None, None, None],
+                owned_planes[None],
+                0.0,
+            )
+            # adding back: the owned matching colours were subtracted above
+            _subtract_matching_colors(
+                spectrum[p : p + 1],
+                -np.fft.rfft2(owned_color_planes),
+                image_colors[p : p + 1],
+                image_masks[p : p + 1],
+                owned_colors,
+                (H, W),
+            )
+
+    return np.fft.irfft2(spectrum, s=(H, W))[..., : H - h + 1, : W - w + 1]
+
+
+def compute_cost_terms_batch(
+    requests: list[PlacementRequest],
+    spectra: GridSpectra | None = None,
+    threads: int | None = None,
+) -> list[np.ndarray]:
+    """
+    Cost terms of several projects in one vectorized pass. Each project goes
+    to the engine choose_placement_engine picks for its image. For the FFT
+    ones the grid spectra are computed once and projects sharing an image
+    shape are stacked into a single batch of FFTs, each result matching
+    compute_cost_terms_fft for that project. The others are gathered with
+    compute_cost_terms_sparse. With several threads (config.PLACEMENT_THREADS
+    by default) the batches are cut into that many groups of projects and run
+    in the placement threads, numpy releasing the GIL during the FFTs.
+    """
+    if spectra is None:
+        spectra = GridSpectra()
+    if threads is None:
+        threads = config.PLACEMENT_THREADS
+    H, W = spectra.shape
+    cost_terms: list[np.ndarray] = [
+        np.empty((NBR_COST_TERMS, 0, 0), dtype=np.float64)
+    ] * len(requests)
+
+    groups: dict[Tuple[int, int], list[int]] = {}
+    sparse: list[int] = []
+    for i, (image_color, image_mask, _) in enumerate(requests):
+        h, w = image_color.shape
+        if h > H or w > W:
+            continue
+        engine = choose_placement_engine(image_color, image_mask, spectra.grid)
+        if engine == PlacementEngine.sparse:
+            sparse.append(i)
+        else:
+            groups.setdefault((h, w), []).append(i)
+    nbr_requests = sum(len(indices) for indices in groups.values())
+    step = max(1, -(-nbr_requests // max(1, threads)))
+    chunks = [
+        indices[start : start + step]
+        for indices in groups.values()
+        for start in range(0, len(indices), step)
+    ]
+
+    for i in sparse:
+        image_color, image_mask, new_owner = requests[i]
+        cost_terms[i] = compute_cost_terms_sparse(
+            image_color, image_mask, new_owner, grid=spectra.grid
+        )
+
+    if threads > 1 and len(chunks) > 1:
+        # the colour spectra are filled once, before the threads read them
+        image_colors = [
+            requests[i][0][requests[i][1].astype(bool)]
+            for chunk in chunks
+            for i in chunk
+        ]
+        spectra.color_spectra(
+            np.intersect1d(
+                distinct_colors(np.concatenate(image_colors)), spectra.colors
+            )
+        )
+        futures = [
+            get_placement_threads().submit(
+                _group_cost_terms, [requests[i] for i in chunk], spectra
+            )
+            for chunk in chunks
+        ]
+        results = [future.result() for future in futures]
+    else:
+        results = [
+            _group_cost_terms([requests[i] for i in chunk], spectra) for chunk in chunks
+        ]
+    for chunk, chunk_cost_terms in zip(chunks, results):
+        for p, i in enumerate(chunk):
+            cost_terms[i] = chunk_cost_terms[p]
+
+    return cost_terms
+
+
+def compute_cost_maps_batch(
+    requests: list[PlacementRequest],
+    spectra: GridSpectra | None = None,
+    threads: int | None = None,
+) -> list[np.ndarray]:
+    # cost maps of several projects, each matching compute_cost_map_fft
+    if spectra is None:
+        spectra = GridSpectra()
+    return [
+        combine_cost_terms(terms, spectra.tolerance)
+        for terms in compute_cost_terms_batch(requests, spectra, threads)
+    ]
+
+
+def find_best_placements_batch(
+    requests: list[PlacementRequest],
+    budgets: list[float],
+    eager: bool = True,
+    *,
+    grid: GridState = GRID,
+) -> list[Tuple[int | None, int | None, float | None]]:
+    results: list[Tuple[int | None, int | None, float | None]] = []
+    cost_maps = compute_cost_maps_batch(requests, GridSpectra(grid))
+    for (image_color, image_mask, new_owner), cost_map, budget in zip(
+        requests, cost_maps, budgets
+    ):
+        if cost_map.size == 0:
+            results.append((None, None, None))
+            continue
+        results.append(
+            select_repriced_placement(
+                cost_map,
+                budget,
+                eager,
+                lambda row, col: exact_placement_cost(
+                    image_color, image_mask, new_owner, row, col, grid=grid
+                ),
+            )
+        )
+    return results
@@ -0,0 +1,80 @@
+from typing import NamedTuple
+import numpy as np
+
+WORD_BITS = 64
+
+
+class PackedMask(NamedTuple):
+    # (rows, words) uint64, bit b of word k of a row is the column 64 * k + b
+    words: np.ndarray
+    width: int
+
+
+def pack_mask(mask: np.ndarray) -> PackedMask:
+    h, w = mask.shape
+    nbr_words = -(-w // WORD_BITS)
+    packed = np.packbits(mask.astype(bool), axis=1, bitorder="little")
+    buffer = np.zeros((h, nbr_words * 8), dtype=np.uint8)
+    buffer[:, : packed.shape[1]] = packed
+    return PackedMask(buffer.view("<u8").astype(np.uint64, copy=False), w)
+
+
+def unpack_mask(packed: PackedMask) -> np.ndarray:
+    buffer = packed.words.astype("<u8", copy=False).view(np.uint8)
+    return np.unpackbits(buffer, axis=1, count=packed.width, bitorder="little").astype(
+        bool
+    )
+
+
+def count_mask(packed: PackedMask) -> int:
+    return int(np.bitwise_count(packed.words).sum())
+
+
+def _tail_mask(width: int) -> np.uint64:
+    # bits of the last word of a row that belong to the mask
+    bits = int(width) % WORD_BITS
+    return np.uint64((1 << bits) - 1 if bits > 0 else (1 << WORD_BITS) - 1)
+
+
+def window_words(packed: PackedMask, row: int, col: int, h: int, w: int) -> np.ndarray:
+    """
+    Words of the (h, w) window at (row, col), shifted so that the column col
+    is bit 0 of the first word, the same layout as pack_mask of the window.
+    """
+    nbr_words = -(-w // WORD_BITS)
+    start, shift = divmod(int(col), WORD_BITS)
+    words = packed.words[row : row + h, start : start + nbr_words + 1]
+    if words.shape[1] < nbr_words + 1:
+        words = np.pad(words, ((0, 0), (0, nbr_words + 1 - words.shape[1])))
+    if shift > 0:
+        window = (words[:, :-1] >> np.uint64(shift)) | (
+            words[:, 1:] << np.uint64(WORD_BITS - shift)
+        )
+    else:
+        window = words[:, :-1].copy()
+    window[:, -1] &= _tail_mask(w)
+    return window
+
+
+def count_overlap(packed: PackedMask, mask: PackedMask, row: int, col: int) -> int:
+    # pixels set in both mask and the window of packed at (row, col)
+    h = mask.words.shape[0]
+    return int(
+        np.bitwise_count(
+            window_words(packed, row, col, h, mask.width) & mask.words
+        ).sum()
+    )
+
+
+def set_window(packed: PackedMask, mask: PackedMask, row: int, col: int):
+    # packed |= mask placed at (row, col), in place
+    h, nbr_words = mask.words.shape
+    start, shift = divmod(int(col), WORD_BITS)
+    rows = packed.words[row : row + h]
+    end = min(start + nbr_words, rows.shape[1])
+    rows[:, start:end] |= mask.words[:, : end - start] << np.uint64(shift)
+    if shift > 0:
+        end = min(start + 1 + nbr_words, rows.shape[1])
+        rows[:, start + 1 : end] |= mask.words[:, : end - start - 1] >> np.uint64(
+            WORD_BITS - shift
+        )
@@ -1,11 +1,17 @@
+from functools import lru_cache
 from typing import Tuple
 import numpy as np
 
-from src.ai.placement.init import grid_weights
+from src.ai.placement.grid_state import GRID
 
+# distinct image shapes whose weight maps are kept around
+WEIGHT_MAPS_CACHE_SIZE = 64
 
-def get_weights_for_image(image_shape: Tuple[int, int]):
-    global_H, global_W = grid_weights.shape
+
+@lru_cache(maxsize=WEIGHT_MAPS_CACHE_SIZE)
+def get_weights_for_image(image_shape: Tuple[int, int]) -> np.ndarray:
+    # normalized weights of the centred image window, shared and read-only
+    global_H, global_W = GRID.weights.shape
     H, W = image_shape
 
     center_row = global_H // 2
@@ -14,10 +20,53 @@ def get_weights_for_image(image_shape: Tuple[int, int]):
     start_row = center_row - H // 2
     start_col = center_col - W // 2
 
-    subgrid = grid_weights[start_row : start_row + H, start_col : start_col + W]
-    norm = subgrid.sum()
-    subgrid /= norm
-    return subgrid
+    subgrid = GRID.weights[start_row : start_row + H, start_col : start_col + W]
+    weights = subgrid / subgrid.sum()
+    weights.setflags(write=False)
+    return weights
+
+
+@lru_cache(maxsize=WEIGHT_MAPS_CACHE_SIZE)
+def get_offset_preference(image_shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Positional preference of every placement offset, shape (H - h + 1, W - w + 1):
+    the grid weights summed over the window, scaled to 1 for the preferred
+    offset and 0 for the least preferred one.
+    """
+    H, W = GRID.weights.shape
+    h, w = image_shape
+    if h > H or w > W:
+        return np.empty((0, 0), dtype=np.float64)
+
+    # window sums from the summed area table
+    table = np.zeros((H + 1, W + 1), dtype=np.float64)
+    table[1:, 1:] = GRID.weights.cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    sums = table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+    low, high = sums.min(), sums.max()
+    preference = (sums - low) / (high - low) if high > low else np.ones_like(sums)
+    preference.setflags(write=False)
+    return preference
+
+
+def clear_weight_maps():
+    # to be called whenever GRID.weights changes
+    get_weights_for_image.cache_clear()
+    get_offset_preference.cache_clear()
+
+
+def weighted_cost_map(
+    cost_map: np.ndarray, image_shape: Tuple[int, int], position_weight: float
+) -> np.ndarray:
+    """
+    Placement objective trading cost against position: the cost of every
+    offset plus position_weight (in ether) scaled by how far the offset is
+    from the preferred one, 0 at the preferred offset and position_weight at
+    the least preferred one.
+    """
+    if position_weight <= 0 or cost_map.size == 0:
+        return cost_map
+    return cost_map + position_weight * (1.0 - get_offset_preference(image_shape))
 
 
 def compute_allocation_of_remaining_budget(
@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from typing import NamedTuple, Tuple
+import time
+import numpy as np
+
+from src.core.config import config
+from src.ai.placement.grid_state import GRID, GridState
+
+# (row0, col0, row1, col1), bounds included
+DirtyRect = Tuple[int, int, int, int]
+# (row, col, cost, image colour ids, mask of the pixels to place)
+Placement = Tuple[int, int, float, np.ndarray, np.ndarray]
+# (best_row, best_col) of a project, None before its first placement
+Position = Tuple[int | None, int | None]
+
+# changes kept in the dirty log, entries older than the log are invalidated
+DIRTY_LOG_SIZE = 100_000
+
+
+class DirtyRegions:
+    """
+    Log of the rectangles changed on the grid, tagged with the grid version
+    right after the change, so that a reader can ask what changed since the
+    version it last saw.
+    """
+
+    def __init__(self, grid: GridState = GRID, size: int = DIRTY_LOG_SIZE):
+        self.grid = grid
+        self.size = size
+        self.versions: list[int] = []
+        self.rects: list[DirtyRect] = []
+        # every change after this version is in the log
+        self.start_version = grid.version
+        grid.add_listener(self.mark_pixel)
+
+    def mark_pixel(self, row: int, col: int, *_):
+        self.mark(row, col, row, col)
+
+    def mark(self, row0: int, col0: int, row1: int, col1: int):
+        self.versions.append(self.grid.version)
+        self.rects.append((row0, col0, row1, col1))
+        if len(self.versions) > 2 * self.size:
+            del self.versions[: -self.size]
+            del self.rects[: -self.size]
+            self.start_version = self.versions[0] - 1
+
+    def since(self, version: int) -> np.ndarray | None:
+        # rects changed after version, None if the log does not go back that far
+        if version < self.start_version:
+            return None
+        start = bisect_right(self.versions, version)
+        return np.array(self.rects[start:], dtype=np.int64).reshape(-1, 4)
+
+
+class CachedPlacements(NamedTuple):
+    version: int
+    budget: float
+    position: Position
+    created_at: float
+    placements: list[Placement]
+
+
+DIRTY_REGIONS = DirtyRegions()
+PLACEMENT_CACHE: dict[str, CachedPlacements] = {}
+
+
+def _touches_windows(rects: np.ndarray, placements: list[Placement]) -> bool:
+    windows = np.array(
+        [
+            (row, col, row + mask.shape[0] - 1, col + mask.shape[1] - 1)
+            for row, col, _, _, mask in placements
+        ],
+        dtype=np.int64,
+    )
+    overlap = (rects[:, None, 0] <= windows[None, :, 2]) & (
+        rects[:, None, 2] >= windows[None, :, 0]
+    )
+    overlap &= (rects[:, None, 1] <= windows[None, :, 3]) & (
+        rects[:, None, 3] >= windows[None, :, 1]
+    )
+    return bool(overlap.any())
+
+
+def get_cached_placements(
+    project_address: str, budget: float, position: Position
+) -> list[Placement] | None:
+    """
+    The placements found for the project on a previous sweep, as long as its
+    budget and current position are the same, the entry is younger than PLACEMENT_CACHE_TTL and
+    nothing changed under any of the placement windows since. Without any
+    placement, any change on the grid invalidates the entry.
+    """
+    cached = PLACEMENT_CACHE.get(project_address)
+    if cached is None:
+        return None
+    if cached.budget != budget or cached.position != position:
+        return None
+    if time.monotonic() - cached.created_at > config.PLACEMENT_CACHE_TTL:
+        return None
+    rects = DIRTY_REGIONS.since(cached.version)
+    if rects is None:
+        return None
+    if len(rects) > 0:
+        if len(cached.placements) == 0 or _touches_windows(rects, cached.placements):
+            return None
+    return cached.placements
+
+
+def cache_placements(
+    project_address: str,
+    budget: float,
+    position: Position,
+    placements: list[Placement],
+):
+    PLACEMENT_CACHE[project_address] = CachedPlacements(
+        version=DIRTY_REGIONS.grid.version,
+        budget=budget,
+        position=position,
+        created_at=time.monotonic(),
+        placements=placements,
+    )
@@ -0,0 +1,74 @@
+from typing import Tuple
+import numpy as np
+
+from src.core.config import config
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_fft import correlate_spectrum
+
+
+class ChurnHeatmap:
+    """
+    Exponentially decaying count of the times each pixel changed hands, with
+    a half-life of config.PLACEMENT_CHURN_HALF_LIFE seconds of block time.
+    Decay is applied lazily: each pixel keeps the time of its last update.
+    Changes are only recorded once started, so that rebuilding the grid at
+    startup does not count as churn.
+    """
+
+    def __init__(self, grid: GridState = GRID, half_life: float | None = None):
+        self.grid = grid
+        self.half_life = (
+            config.PLACEMENT_CHURN_HALF_LIFE if half_life is None else half_life
+        )
+        self.heat: np.ndarray = np.zeros(grid.shape, dtype=np.float64)
+        self.updated_at: np.ndarray = np.zeros(grid.shape, dtype=np.float64)
+        # latest block time seen, the changes are recorded and the heatmap
+        # read at that time
+        self.now = 0.0
+        self.started = False
+
+    def _decay(self, elapsed: np.ndarray | float) -> np.ndarray | float:
+        return np.exp2(-np.maximum(elapsed, 0.0) / self.half_life)
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.grid.add_listener(self.record)
+
+    def advance(self, timestamp: float):
+        self.now = max(self.now, timestamp)
+
+    def record(self, row: int, col: int, old_color: int, old_owner: int, *_):
+        # counts changes of owner only
+        if int(self.grid.owner[row, col]) == old_owner:
+            return
+        elapsed = self.now - self.updated_at[row, col]
+        self.heat[row, col] = self.heat[row, col] * self._decay(elapsed) + 1.0
+        self.updated_at[row, col] = self.now
+
+    def heatmap(self) -> np.ndarray:
+        return self.heat * self._decay(self.now - self.updated_at)
+
+
+CHURN = ChurnHeatmap()
+
+
+def churn_penalty_map(
+    image_mask: np.ndarray, churn_weight: float, churn: ChurnHeatmap = CHURN
+) -> np.ndarray:
+    """
+    Penalty of every placement offset, shape (H - h + 1, W - w + 1):
+    churn_weight (in ether) for every recent change of owner under the active
+    pixels of the window.
+    """
+    H, W = churn.grid.shape
+    h, w = image_mask.shape
+    if h > H or w > W:
+        return np.empty((0, 0), dtype=np.float64)
+    shape: Tuple[int, int] = (H, W)
+    sums = np.fft.irfft2(
+        np.fft.rfft2(churn.heatmap())
+        * correlate_spectrum(image_mask.astype(np.float64), shape),
+        s=shape,
+    )[: H - h + 1, : W - w + 1]
+    return churn_weight * np.maximum(sums, 0.0)
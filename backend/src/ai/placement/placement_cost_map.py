@@ -0,0 +1,165 @@
+from typing import Callable, Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+
+# float stake of a pixel nobody staked on, the 1 wei it takes to buy it
+EMPTY_STAKE = 1e-18
+# stake of the staked pixels, number of unstaked pixels, number of staked pixels
+NBR_COST_TERMS = 3
+
+
+def exact_placement_cost_wei(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    row: int,
+    col: int,
+    *,
+    grid: GridState = GRID,
+) -> int:
+    # minimum amount in wei to take the window: stake + 1 of every pixel to buy
+    h, w = image_color.shape
+    region_color = grid.color[row : row + h, col : col + w]
+    region_owner = grid.owner[row : row + h, col : col + w]
+    condition = (region_color != image_color) & (region_owner != new_owner) & image_mask
+    rows, cols = np.nonzero(condition)
+    return grid.stake_wei(rows + row, cols + col) + len(rows)
+
+
+def exact_placement_cost(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    row: int,
+    col: int,
+    *,
+    grid: GridState = GRID,
+) -> float:
+    # same per-window cost as find_best_placement_full, for a single offset,
+    # summed exactly in wei and rounded once
+    cost = exact_placement_cost_wei(
+        image_color, image_mask, new_owner, row, col, grid=grid
+    )
+    return cost / 10**18
+
+
+def cost_term_planes(grid: GridState, included: np.ndarray) -> np.ndarray:
+    """
+    The (NBR_COST_TERMS, H, W) planes whose window sums make up a cost map,
+    restricted to the included pixels: the stake of the staked pixels, 1 for
+    every unstaked pixel and 1 for every staked pixel.
+    """
+    staked = included & (grid.stake > EMPTY_STAKE)
+    return np.stack(
+        [
+            np.where(staked, grid.stake, 0.0),
+            (included & ~staked).astype(np.float64),
+            staked.astype(np.float64),
+        ]
+    )
+
+
+def cost_tolerance(grid: GridState) -> float:
+    # round-off of a window sum of stakes computed by FFT
+    return 16 * np.finfo(np.float64).eps * float(grid.stake.sum())
+
+
+def combine_cost_terms(terms: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Cost map from the window sums of cost_term_planes, computed with up to
+    tolerance of round-off. The pixel counts are rounded to integers, so that a
+    window with nothing staked costs exactly 1 wei per pixel like in
+    find_best_placement_full. The stakes are rounded to multiples of the
+    tolerance, at least one, so that windows tied up to round-off keep the
+    row-major order.
+    """
+    stakes, nbr_unstaked, nbr_staked = terms
+    if tolerance > 0:
+        stakes = tolerance * np.maximum(np.rint(stakes / tolerance), 1.0)
+    cost_map = np.where(np.rint(nbr_staked) >= 1, stakes, 0.0)
+    return cost_map + np.maximum(np.rint(nbr_unstaked), 0.0) * EMPTY_STAKE
+
+
+def select_best_placement(
+    cost_map: np.ndarray,
+    budget: float,
+    eager: bool = True,
+) -> Tuple[int | None, int | None, float | None]:
+    """
+    Pick an offset from a (H - h + 1, W - w + 1) cost map with the same rules as
+    find_best_placement_full: the cheapest affordable offset, ties broken in
+    row-major order, or the first affordable offset in row-major order if eager.
+    """
+    affordable = cost_map <= budget
+    if not affordable.any():
+        return None, None, None
+
+    if eager:
+        idx = int(np.argmax(affordable))
+    else:
+        idx = int(np.argmin(np.where(affordable, cost_map, np.inf)))
+    row, col = np.unravel_index(idx, cost_map.shape)
+    return int(row), int(col), float(cost_map[row, col])
+
+
+def select_repriced_placement(
+    cost_map: np.ndarray,
+    budget: float,
+    eager: bool,
+    price: Callable[[int, int], float],
+) -> Tuple[int | None, int | None, float | None]:
+    # cost maps built by FFT or by patching carry round-off, so the selected
+    # offset is re-priced exactly and dropped if it turns out to be over budget
+    while True:
+        best_row, best_col, _ = select_best_placement(cost_map, budget, eager)
+        if best_row is None or best_col is None:
+            return None, None, None
+        best_cost = price(best_row, best_col)
+        if best_cost <= budget:
+            return best_row, best_col, best_cost
+        cost_map = cost_map.copy()
+        cost_map[best_row, best_col] = np.inf
+
+
+def select_top_placements(
+    cost_map: np.ndarray,
+    budget: float,
+    k: int,
+    window: Tuple[int, int] | None = None,
+    objective: np.ndarray | None = None,
+) -> list[Tuple[int, int, float]]:
+    """
+    The k cheapest affordable offsets by ascending cost, ties in row-major order.
+    When the image window (h, w) is given, an offset is skipped if its window
+    overlaps the window of an offset already selected. An objective map of the
+    same shape, e.g. weighted_cost_map, ranks the affordable offsets instead
+    of their cost.
+    """
+    placements: list[Tuple[int, int, float]] = []
+    if cost_map.size == 0:
+        return placements
+    if objective is None:
+        objective = cost_map
+    costs = np.where(cost_map <= budget, objective, np.inf)
+
+    if window is None:
+        flat = costs.ravel()
+        n = min(k, int(np.count_nonzero(np.isfinite(flat))))
+        if n == 0:
+            return placements
+        idx = np.argpartition(flat, n - 1)[:n]
+        idx = idx[np.lexsort((idx, flat[idx]))]
+        for row, col in zip(*np.unravel_index(idx, cost_map.shape)):
+            placements.append((int(row), int(col), float(cost_map[row, col])))
+        return placements
+
+    h, w = window
+    while len(placements) < k:
+        row, col = np.unravel_index(int(np.argmin(costs)), costs.shape)
+        if not np.isfinite(costs[row, col]):
+            break
+        placements.append((int(row), int(col), float(cost_map[row, col])))
+        # every offset whose window intersects this one
+        costs[max(0, row - h + 1) : row + h, max(0, col - w + 1) : col + w] = np.inf
+    return placements
@@ -0,0 +1,105 @@
+from enum import Enum
+from typing import Tuple
+import numpy as np
+
+from src.core.config import config
+from src.ai.placement.grid_state import GRID, GridState, distinct_colors
+from src.ai.placement.placement_fft import (
+    compute_cost_map_fft,
+    compute_cost_terms_fft,
+    find_best_placement_fft,
+)
+from src.ai.placement.placement_sparse import (
+    compute_cost_map_sparse,
+    compute_cost_terms_sparse,
+    find_best_placement_sparse,
+)
+from src.ai.placement.placement_pyramid import find_best_placement_pyramid
+
+
+class PlacementEngine(Enum):
+    fft = "fft"
+    sparse = "sparse"
+    # best placement only, not exact, see find_best_placement_pyramid
+    pyramid = "pyramid"
+
+
+# below this fraction of active pixels the sparse gather beats the FFT
+SPARSE_DENSITY_THRESHOLD = 0.1
+# the FFT engine does one transform per shared colour, past this many
+# distinct image colours the sparse gather is cheaper at any density
+MAX_FFT_COLORS = 64
+
+
+def choose_placement_engine(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    grid: GridState = GRID,
+    cost_map: bool = True,
+) -> PlacementEngine:
+    # the pyramid is only chosen when no cost map is needed, past
+    # config.PLACEMENT_PYRAMID_MIN_OFFSETS offsets (0 never)
+    h, w = image_mask.shape
+    nbr_offsets = max(grid.height - h + 1, 0) * max(grid.width - w + 1, 0)
+    if (
+        not cost_map
+        and config.PLACEMENT_PYRAMID_MIN_OFFSETS > 0
+        and nbr_offsets >= config.PLACEMENT_PYRAMID_MIN_OFFSETS
+    ):
+        return PlacementEngine.pyramid
+    nbr_active_pixels = int(np.count_nonzero(image_mask))
+    if nbr_active_pixels <= SPARSE_DENSITY_THRESHOLD * h * w:
+        return PlacementEngine.sparse
+    if len(distinct_colors(image_color[image_mask.astype(bool)])) > MAX_FFT_COLORS:
+        return PlacementEngine.sparse
+    return PlacementEngine.fft
+
+
+def compute_cost_map(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    engine: PlacementEngine | None = None,
+    grid: GridState = GRID,
+) -> np.ndarray:
+    # grid can be swapped for another state, e.g. a shared memory snapshot.
+    # The pyramid computes no cost map, the FFT engine stands in for it
+    if engine is None:
+        engine = choose_placement_engine(image_color, image_mask, grid)
+    if engine == PlacementEngine.sparse:
+        return compute_cost_map_sparse(image_color, image_mask, new_owner, grid=grid)
+    return compute_cost_map_fft(image_color, image_mask, new_owner, grid=grid)
+
+
+def compute_cost_terms(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    engine: PlacementEngine | None = None,
+    grid: GridState = GRID,
+) -> np.ndarray:
+    # window sums of the cost terms, see combine_cost_terms
+    if engine is None:
+        engine = choose_placement_engine(image_color, image_mask, grid)
+    if engine == PlacementEngine.sparse:
+        return compute_cost_terms_sparse(image_color, image_mask, new_owner, grid=grid)
+    return compute_cost_terms_fft(image_color, image_mask, new_owner, grid=grid)
+
+
+def find_best_placement(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    eager: bool = True,
+    engine: PlacementEngine | None = None,
+) -> Tuple[int | None, int | None, float | None]:
+    if engine is None:
+        engine = choose_placement_engine(image_color, image_mask, cost_map=False)
+    if engine == PlacementEngine.pyramid:
+        return find_best_placement_pyramid(image_color, image_mask, new_owner, budget)
+    if engine == PlacementEngine.sparse:
+        return find_best_placement_sparse(
+            image_color, image_mask, new_owner, budget, eager
+        )
+    return find_best_placement_fft(image_color, image_mask, new_owner, budget, eager)
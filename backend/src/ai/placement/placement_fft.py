@@ -0,0 +1,106 @@
+from typing import Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState, distinct_colors
+from src.ai.placement.placement_cost_map import (
+    NBR_COST_TERMS,
+    combine_cost_terms,
+    cost_term_planes,
+    cost_tolerance,
+    exact_placement_cost,
+    select_repriced_placement,
+)
+
+# number of planes transformed together, bounds the temporary memory
+COLOR_BATCH_SIZE = 64
+
+
+def correlate_spectrum(kernels: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    # conjugate spectrum of the kernels zero padded to the grid shape, so that
+    # irfft2(grid_spectrum * kernel_spectrum) is the cross-correlation
+    return np.conj(np.fft.rfft2(kernels, s=shape))
+
+
+def compute_cost_terms_fft(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    *,
+    grid: GridState = GRID,
+) -> np.ndarray:
+    """
+    Window sums of the cost terms (see cost_term_planes) of every placement
+    offset at once, shape (NBR_COST_TERMS, H - h + 1, W - w + 1).
+
+    terms = corr(planes * not_owned, mask)
+          - sum over colours c of corr(planes * not_owned * [grid == c], mask * [image == c])
+
+    Only colours present both in the image and on the grid contribute to the
+    second term. All correlations are accumulated in the frequency domain and
+    inverted once.
+    """
+    H, W = grid.shape
+    h, w = image_color.shape
+    if h > H or w > W:
+        return np.empty((NBR_COST_TERMS, 0, 0), dtype=np.float64)
+
+    not_owned = grid.owner != new_owner
+    planes = cost_term_planes(grid, not_owned)
+    active = image_mask.astype(bool)
+
+    spectrum = np.fft.rfft2(planes) * correlate_spectrum(
+        active.astype(np.float64), (H, W)
+    )
+
+    image_colors = distinct_colors(image_color[active])
+    shared_colors = np.intersect1d(image_colors, distinct_colors(grid.color[not_owned]))
+    step = max(1, COLOR_BATCH_SIZE // NBR_COST_TERMS)
+    for start in range(0, len(shared_colors), step):
+        colors = shared_colors[start : start + step]
+        grid_planes = np.where(
+            grid.color[None, None, :, :] == colors[None, :, None, None],
+            planes[:, None],
+            0.0,
+        )
+        image_planes = (
+            (image_color[None, :, :] == colors[:, None, None]) & active[None]
+        ).astype(np.float64)
+        spectrum -= np.sum(
+            np.fft.rfft2(grid_planes) * correlate_spectrum(image_planes, (H, W)),
+            axis=1,
+        )
+
+    return np.fft.irfft2(spectrum, s=(H, W))[:, : H - h + 1, : W - w + 1]
+
+
+def compute_cost_map_fft(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    *,
+    grid: GridState = GRID,
+) -> np.ndarray:
+    # cost of every placement offset at once, shape (H - h + 1, W - w + 1)
+    terms = compute_cost_terms_fft(image_color, image_mask, new_owner, grid=grid)
+    return combine_cost_terms(terms, cost_tolerance(grid))
+
+
+def find_best_placement_fft(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    eager: bool = True,
+) -> Tuple[int | None, int | None, float | None]:
+    cost_map = compute_cost_map_fft(image_color, image_mask, new_owner)
+    if cost_map.size == 0:
+        return None, None, None
+
+    return select_repriced_placement(
+        cost_map,
+        budget,
+        eager,
+        lambda row, col: exact_placement_cost(
+            image_color, image_mask, new_owner, row, col
+        ),
+    )
@@ -0,0 +1,63 @@
+from typing import Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_cost_map import exact_placement_cost
+
+
+def sunk_stake(
+    image_mask: np.ndarray,
+    owner: int,
+    row: int,
+    col: int,
+    *,
+    grid: GridState = GRID,
+) -> float:
+    # stake owner already holds under the active pixels of the window
+    h, w = image_mask.shape
+    region_owner = grid.owner[row : row + h, col : col + w]
+    region_stake = grid.stake[row : row + h, col : col + w]
+    return float(np.sum(region_stake[(region_owner == owner) & image_mask]))
+
+
+def kept_placement_cost(
+    candidates: list[Tuple[int, int, float]],
+    current: Tuple[int | None, int | None],
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    *,
+    absolute_margin: float,
+    relative_margin: float,
+    grid: GridState = GRID,
+) -> float | None:
+    """
+    Cost of the current placement if it is kept, None if the project should
+    move. The best candidate must beat it by max(absolute_margin,
+    relative_margin * (current cost + sunk stake)). Moving leaves the stake
+    already paid at the current spot behind, so the more a project has
+    invested there the more a relocation must save. The image is the one the
+    current spot was taken with.
+    """
+    row, col = current
+    H, W = grid.shape
+    h, w = image_color.shape
+    if row is None or col is None or row < 0 or col < 0:
+        return None
+    if row + h > H or col + w > W:
+        return None
+
+    cost = exact_placement_cost(image_color, image_mask, new_owner, row, col, grid=grid)
+    if cost > budget:
+        return None
+    others = [c for c in candidates if (c[0], c[1]) != (row, col)]
+    if len(others) > 0:
+        margin = max(
+            absolute_margin,
+            relative_margin
+            * (cost + sunk_stake(image_mask, new_owner, row, col, grid=grid)),
+        )
+        if others[0][2] + margin < cost:
+            return None
+    return cost
@@ -0,0 +1,288 @@
+from typing import Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID
+from src.ai.placement.placement_cost_map import (
+    EMPTY_STAKE,
+    NBR_COST_TERMS,
+    combine_cost_terms,
+    cost_tolerance,
+    exact_placement_cost,
+    select_top_placements,
+)
+from src.ai.placement.placement_engine import compute_cost_terms
+from src.ai.placement.placement_batch import compute_cost_terms_batch
+from src.ai.placement.placement_budget import weighted_cost_map
+from src.ai.placement.placement_churn import churn_penalty_map
+from src.ai.placement.placement_partial import (
+    PARTIAL_CANDIDATES,
+    find_partial_placement,
+)
+from src.ai.placement.placement_pool import compute_cost_terms_offloaded
+
+# (color, owner, stake) of a pixel
+PixelState = Tuple[int, int, float]
+# (row, col, old state, new state)
+PixelChange = Tuple[int, int, PixelState, PixelState]
+
+# patches accumulate float round-off, rebuild the map from scratch after this
+# many (see rebuild_project_cost_maps_offloaded)
+REBUILD_EVERY = 10_000
+
+
+class IncrementalCostMap:
+    """
+    Cost map of one project kept in sync with the grid. A pixel change only
+    patches the offsets whose window covers that pixel, so keeping the map
+    current costs O(image area) per changed pixel and the placements are
+    ranked on the maintained array.
+
+    The cost terms (see combine_cost_terms) are patched rather than the cost
+    map, so that the round-off of the stakes added and removed never hides
+    the 1 wei of the pixels to buy.
+
+    Patching runs inline in the grid listeners. Past REBUILD_EVERY patches the
+    map is only flagged stale, rebuilding it is left to the placement pool.
+    """
+
+    def __init__(
+        self,
+        image_color: np.ndarray,
+        image_mask: np.ndarray,
+        new_owner: int,
+        terms: np.ndarray | None = None,
+        pending: bool = False,
+    ):
+        self.image_color = image_color
+        self.image_mask = image_mask.astype(bool)
+        self.new_owner = new_owner
+        # while the map is computed elsewhere (e.g. in the placement pool on a
+        # grid snapshot) changes are buffered and replayed on install
+        self.pending_changes: list[PixelChange] | None = None
+        if pending:
+            self.pending_changes = []
+            terms = np.empty((NBR_COST_TERMS, 0, 0), dtype=np.float64)
+        elif terms is None:
+            terms = compute_cost_terms(self.image_color, self.image_mask, new_owner)
+        self.set_terms(terms)
+
+    def set_terms(self, terms: np.ndarray):
+        self.nbr_patches = 0
+        self.stale = False
+        self.terms = terms
+        self.tolerance = cost_tolerance(GRID)
+        self.cost_map = combine_cost_terms(terms, self.tolerance)
+
+    def install(self, terms: np.ndarray):
+        # the replayed changes only ever patch the installed terms, a rebuild
+        # from the live grid would apply the remaining ones twice
+        pending_changes = self.pending_changes or []
+        self.pending_changes = None
+        self.set_terms(terms)
+        for row, col, old, new in pending_changes:
+            self.apply_change(row, col, old, new)
+
+    def patch(
+        self, row: int, col: int, old_color: int, old_owner: int, old_stake: float
+    ):
+        old: PixelState = (old_color, old_owner, old_stake)
+        new: PixelState = (
+            int(GRID.color[row, col]),
+            int(GRID.owner[row, col]),
+            float(GRID.stake[row, col]),
+        )
+        if self.pending_changes is not None:
+            self.pending_changes.append((row, col, old, new))
+        # a map being rebuilt stays current until the new one is installed
+        self.apply_change(row, col, old, new)
+
+    def apply_change(self, row: int, col: int, old: PixelState, new: PixelState):
+        if self.cost_map.size == 0:
+            return
+        h, w = self.image_color.shape
+        out_h, out_w = self.cost_map.shape
+
+        # offsets (y, x) whose window contains (row, col)
+        y0, y1 = max(0, row - h + 1), min(row, out_h - 1)
+        x0, x1 = max(0, col - w + 1), min(col, out_w - 1)
+        if y0 > y1 or x0 > x1:
+            return
+
+        # image pixel landing on (row, col) for each of those offsets
+        sub_color = self.image_color[row - y1 : row - y0 + 1, col - x1 : col - x0 + 1]
+        sub_mask = self.image_mask[row - y1 : row - y0 + 1, col - x1 : col - x0 + 1]
+        sub_color = sub_color[::-1, ::-1]
+        sub_mask = sub_mask[::-1, ::-1]
+
+        def contribution(state: PixelState) -> np.ndarray:
+            # the pixel in each of the cost_term_planes, where it is to buy
+            color, owner, stake = state
+            terms = np.zeros((NBR_COST_TERMS,) + sub_mask.shape, dtype=np.float64)
+            if owner == self.new_owner:
+                return terms
+            to_buy = sub_mask & (sub_color != color)
+            if stake > EMPTY_STAKE:
+                terms[0][to_buy] = stake
+                terms[2][to_buy] = 1.0
+            else:
+                terms[1][to_buy] = 1.0
+            return terms
+
+        region = (slice(y0, y1 + 1), slice(x0, x1 + 1))
+        terms = self.terms[(slice(None),) + region]
+        terms += contribution(new) - contribution(old)
+        self.cost_map[region] = combine_cost_terms(terms, self.tolerance)
+
+        self.nbr_patches += 1
+        if self.nbr_patches >= REBUILD_EVERY:
+            self.stale = True
+
+    def find_top_placements(
+        self,
+        budget: float,
+        k: int,
+        non_overlapping: bool = False,
+        position_weight: float = 0.0,
+        churn_weight: float = 0.0,
+    ) -> list[Tuple[int, int, float]]:
+        # with a position_weight the offsets are ranked by weighted_cost_map,
+        # with a churn_weight contested regions are penalized
+        window = self.image_color.shape if non_overlapping else None
+        objective = weighted_cost_map(
+            self.cost_map, self.image_color.shape, position_weight
+        )
+        if churn_weight > 0 and objective.size > 0:
+            objective = objective + churn_penalty_map(self.image_mask, churn_weight)
+        placements: list[Tuple[int, int, float]] = []
+        penalties: list[float] = []
+        for row, col, _ in select_top_placements(
+            self.cost_map, budget, k, window, objective
+        ):
+            cost = exact_placement_cost(
+                self.image_color, self.image_mask, self.new_owner, row, col
+            )
+            if cost <= budget:
+                placements.append((row, col, cost))
+                penalties.append(objective[row, col] - self.cost_map[row, col])
+        order = np.argsort(
+            [cost + penalty for (_, _, cost), penalty in zip(placements, penalties)],
+            kind="stable",
+        )
+        return [placements[i] for i in order]
+
+    def find_partial_placement(
+        self,
+        budget: float,
+        nbr_candidates: int = PARTIAL_CANDIDATES,
+        weights: np.ndarray | None = None,
+    ) -> Tuple[int | None, int | None, np.ndarray | None, float | None]:
+        # tried on the cheapest offsets, whatever their full cost
+        candidates = select_top_placements(self.cost_map, np.inf, nbr_candidates)
+        return find_partial_placement(
+            self.image_color,
+            self.image_mask,
+            self.new_owner,
+            budget,
+            np.array([row for row, _, _ in candidates], dtype=np.int64),
+            np.array([col for _, col, _ in candidates], dtype=np.int64),
+            weights=weights,
+        )
+
+
+PROJECT_COST_MAPS: dict[str, IncrementalCostMap] = {}
+
+
+def get_project_cost_map(project_address: str) -> IncrementalCostMap | None:
+    return PROJECT_COST_MAPS.get(project_address)
+
+
+def create_project_cost_maps(
+    projects: list[Tuple[str, np.ndarray, np.ndarray, int]],
+) -> list[IncrementalCostMap]:
+    # builds the initial maps of many projects in one batched pass
+    cost_terms = compute_cost_terms_batch(
+        [
+            (image_color, image_mask, new_owner)
+            for _, image_color, image_mask, new_owner in projects
+        ]
+    )
+    project_cost_maps: list[IncrementalCostMap] = []
+    for (project_address, image_color, image_mask, new_owner), terms in zip(
+        projects, cost_terms
+    ):
+        project_cost_map = IncrementalCostMap(
+            image_color, image_mask, new_owner, terms=terms
+        )
+        PROJECT_COST_MAPS[project_address] = project_cost_map
+        project_cost_maps.append(project_cost_map)
+    return project_cost_maps
+
+
+async def create_project_cost_maps_offloaded(
+    projects: list[Tuple[str, np.ndarray, np.ndarray, int]],
+) -> list[IncrementalCostMap]:
+    # same as create_project_cost_maps but computed in the placement pool, the
+    # maps are registered right away and catch up on the changes made meanwhile
+    project_cost_maps: list[IncrementalCostMap] = []
+    for project_address, image_color, image_mask, new_owner in projects:
+        project_cost_map = IncrementalCostMap(
+            image_color, image_mask, new_owner, pending=True
+        )
+        PROJECT_COST_MAPS[project_address] = project_cost_map
+        project_cost_maps.append(project_cost_map)
+    try:
+        cost_terms = await compute_cost_terms_offloaded(
+            [
+                (image_color, image_mask, new_owner)
+                for _, image_color, image_mask, new_owner in projects
+            ]
+        )
+    except BaseException:
+        for project_address, *_ in projects:
+            PROJECT_COST_MAPS.pop(project_address, None)
+        raise
+    for project_cost_map, terms in zip(project_cost_maps, cost_terms):
+        project_cost_map.install(terms)
+    return project_cost_maps
+
+
+async def rebuild_project_cost_maps_offloaded():
+    # stale maps are recomputed in the placement pool, buffering the changes
+    # made meanwhile like new maps
+    stale = [
+        project_cost_map
+        for project_cost_map in PROJECT_COST_MAPS.values()
+        if project_cost_map.stale and project_cost_map.pending_changes is None
+    ]
+    if len(stale) == 0:
+        return
+    for project_cost_map in stale:
+        project_cost_map.pending_changes = []
+    try:
+        cost_terms = await compute_cost_terms_offloaded(
+            [
+                (
+                    project_cost_map.image_color,
+                    project_cost_map.image_mask,
+                    project_cost_map.new_owner,
+                )
+                for project_cost_map in stale
+            ]
+        )
+    except BaseException:
+        # the old terms were kept patched, the rebuild is tried again later
+        for project_cost_map in stale:
+            project_cost_map.pending_changes = None
+        raise
+    for project_cost_map, terms in zip(stale, cost_terms):
+        project_cost_map.install(terms)
+
+
+def patch_project_cost_maps(
+    row: int, col: int, old_color: int, old_owner: int, old_stake: float
+):
+    for project_cost_map in PROJECT_COST_MAPS.values():
+        project_cost_map.patch(row, col, old_color, old_owner, old_stake)
+
+
+GRID.add_listener(patch_project_cost_maps)
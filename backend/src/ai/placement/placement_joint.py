@@ -0,0 +1,82 @@
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_cache import Placement
+from src.ai.placement.placement_bits import (
+    PackedMask,
+    count_mask,
+    count_overlap,
+    pack_mask,
+    set_window,
+)
+
+
+def assign_joint_placements(
+    project_placements: dict[int, list[Placement]],
+    *,
+    grid: GridState = GRID,
+) -> dict[int, list[Placement]]:
+    """
+    Placements of projects run by the same account, keyed by owner id, so
+    that none of them outbids another. Over all the (project, candidate)
+    pairs, the ones covering the most pixels are taken first. On a tie the
+    projects go by the cost of their first such candidate, and each project
+    tries its candidates in its own order (e.g. its kept spot first). A pair
+    is taken as long as the project has no placement yet and none of its
+    active pixels is claimed by another project. The pixels a project holds
+    stay claimed by it, wherever it is placed. The candidates left to a
+    project, its assigned one first, are the ones clear of every other
+    project.
+    """
+    # claimed pixels and placement masks are bit-packed, checking a pair is a
+    # few AND and popcount over words
+    held = {
+        owner: pack_mask(grid.owner == owner) for owner in project_placements.keys()
+    }
+    claimed = pack_mask(np.zeros(grid.shape, dtype=bool))
+    for held_mask in held.values():
+        claimed.words[...] |= held_mask.words
+    masks: dict[int, list[PackedMask]] = {
+        owner: [pack_mask(placement[4]) for placement in placements]
+        for owner, placements in project_placements.items()
+    }
+
+    pairs = []
+    for owner, placements in project_placements.items():
+        lead_costs: dict[int, float] = {}
+        for i, placement in enumerate(placements):
+            count = count_mask(masks[owner][i])
+            lead_cost = lead_costs.setdefault(count, placement[2])
+            pairs.append((-count, lead_cost, owner, i))
+    pairs.sort()
+    assigned: dict[int, int] = {}
+    for _, _, owner, i in pairs:
+        row, col = project_placements[owner][i][:2]
+        if owner in assigned:
+            continue
+        # the pixels the project holds itself do not block it
+        others = PackedMask(claimed.words & ~held[owner].words, claimed.width)
+        if count_overlap(others, masks[owner][i], row, col) > 0:
+            continue
+        assigned[owner] = i
+        set_window(claimed, masks[owner][i], row, col)
+
+    result: dict[int, list[Placement]] = {}
+    for owner, placements in project_placements.items():
+        i = assigned.get(owner)
+        if i is None:
+            result[owner] = []
+            continue
+        # the fallbacks must not touch the pixels claimed by the others
+        others = PackedMask(claimed.words.copy(), claimed.width)
+        row, col = placements[i][:2]
+        own = PackedMask(np.zeros_like(claimed.words), claimed.width)
+        set_window(own, masks[owner][i], row, col)
+        others.words[...] &= ~(own.words | held[owner].words)
+        result[owner] = [placements[i]] + [
+            placement
+            for j, placement in enumerate(placements)
+            if j != i
+            and count_overlap(others, masks[owner][j], placement[0], placement[1]) == 0
+        ]
+    return result
@@ -0,0 +1,58 @@
+from typing import Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+
+# cheapest offsets of the cost map tried by the partial placement
+PARTIAL_CANDIDATES = 16
+
+
+def find_partial_placement(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    offset_rows: np.ndarray,
+    offset_cols: np.ndarray,
+    *,
+    weights: np.ndarray | None = None,
+    grid: GridState = GRID,
+) -> Tuple[int | None, int | None, np.ndarray | None, float | None]:
+    """
+    Placement of a subset of the image for when no offset is affordable as a
+    whole. At each of the given offsets the pixels already showing the right
+    colour or owned by new_owner are covered for free, the others are bought
+    cheapest first until the budget runs out, which maximizes the number of
+    covered pixels. With (positive) per-pixel weights they are bought by
+    ascending stake per weight instead, a greedy for the weighted coverage.
+
+    Returns the offset covering the most, its mask of pixels to place and the
+    cost of that subset.
+    """
+    rows, cols = np.nonzero(image_mask)
+    if len(rows) == 0 or len(offset_rows) == 0:
+        return None, None, None, None
+
+    W = grid.width
+    window_origins = np.asarray(offset_rows) * W + np.asarray(offset_cols)
+    idx = window_origins[:, None] + (rows * W + cols)[None, :]
+    to_buy = grid.color.ravel()[idx] != image_color[rows, cols][None, :]
+    to_buy &= grid.owner.ravel()[idx] != new_owner
+    pixel_costs = np.where(to_buy, grid.stake.ravel()[idx], 0.0)
+
+    values = np.ones(len(rows)) if weights is None else weights[rows, cols]
+    order = np.argsort(pixel_costs / values[None, :], axis=1, kind="stable")
+    sorted_costs = np.take_along_axis(pixel_costs, order, axis=1)
+    # costs are non negative, so the affordable pixels form a prefix
+    affordable = np.cumsum(sorted_costs, axis=1) <= budget
+    covered = np.sum(np.where(affordable, values[order], 0.0), axis=1)
+
+    # first candidate wins ties, the offsets are expected cheapest first
+    best = int(np.argmax(covered))
+    if covered[best] == 0:
+        return None, None, None, None
+    picked = order[best, : np.count_nonzero(affordable[best])]
+    mask = np.zeros(image_mask.shape, dtype=bool)
+    mask[rows[picked], cols[picked]] = True
+    cost = float(pixel_costs[best, picked].sum())
+    return int(offset_rows[best]), int(offset_cols[best]), mask, cost
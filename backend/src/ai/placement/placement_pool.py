@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Tuple
+import asyncio
+import numpy as np
+
+from src.core.config import config
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_batch import (
+    GridSpectra,
+    PlacementRequest,
+    compute_cost_terms_batch,
+)
+
+# (shared memory name, grid shape, palette id dtype), enough for a worker to
+# map the grid
+GridSnapshot = Tuple[str, Tuple[int, int], str]
+
+placement_pool: ProcessPoolExecutor | None = None
+
+
+def get_placement_pool() -> ProcessPoolExecutor:
+    global placement_pool
+    if placement_pool is None:
+        placement_pool = ProcessPoolExecutor(
+            max_workers=config.PLACEMENT_POOL_SIZE, mp_context=get_context("spawn")
+        )
+    return placement_pool
+
+
+def shutdown_placement_pool():
+    global placement_pool
+    if placement_pool is not None:
+        placement_pool.shutdown(wait=False, cancel_futures=True)
+        placement_pool = None
+
+
+def _grid_dtypes(color_dtype: Any) -> list[np.dtype]:
+    # stake, owner then color, widest first so that every view stays aligned
+    return [GRID.stake.dtype, GRID.owner.dtype, np.dtype(color_dtype)]
+
+
+def _grid_views(
+    buffer: Any, shape: Tuple[int, int], color_dtype: Any
+) -> list[np.ndarray]:
+    views: list[np.ndarray] = []
+    offset = 0
+    for dtype in _grid_dtypes(color_dtype):
+        view = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        views.append(view)
+        offset += view.nbytes
+    return views
+
+
+def share_grid() -> Tuple[SharedMemory, GridSnapshot]:
+    # copies the grid once into shared memory, workers map it without pickling
+    shape = GRID.shape
+    color_dtype = GRID.color.dtype
+    size = sum(dtype.itemsize for dtype in _grid_dtypes(color_dtype))
+    shm = SharedMemory(create=True, size=size * shape[0] * shape[1])
+    for view, array in zip(
+        _grid_views(shm.buf, shape, color_dtype), (GRID.stake, GRID.owner, GRID.color)
+    ):
+        view[...] = array
+    return shm, (shm.name, shape, color_dtype.str)
+
+
+def _run_on_grid(snapshot: GridSnapshot, task: Callable, *args: Any) -> Any:
+    name, shape, color_dtype = snapshot
+    # the parent owns and unlinks the segment, the worker only maps it
+    shm = SharedMemory(name=name, track=False)
+    views = _grid_views(shm.buf, shape, color_dtype)
+    stake, owner, color = views
+    grid = GridState.from_arrays(color, owner, stake)
+    try:
+        return task(*args, grid=grid)
+    finally:
+        del grid, stake, owner, color
+        views.clear()
+        shm.close()
+
+
+def _cost_terms_task(
+    requests: list[PlacementRequest], *, grid: GridState
+) -> list[np.ndarray]:
+    spectra = GridSpectra(grid)
+    return compute_cost_terms_batch(requests, spectra)
+
+
+async def run_on_grid(task: Callable, *args: Any) -> Any:
+    """
+    Run a placement task in the process pool against a snapshot of the grid
+    taken now. The event loop only pays for copying the grid into shared memory.
+    """
+    shm, snapshot = share_grid()
+    try:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_placement_pool(), _run_on_grid, snapshot, task, *args
+        )
+        return await asyncio.wait_for(future, timeout=config.PLACEMENT_TASK_TIMEOUT)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+async def compute_cost_terms_offloaded(
+    requests: list[PlacementRequest],
+) -> list[np.ndarray]:
+    return await run_on_grid(_cost_terms_task, requests)
@@ -1,7 +1,7 @@
 from typing import Tuple
 import numpy as np
 
-from src.ai.placement.init import grid_color, grid_stake, grid_owner
+from src.ai.placement.grid_state import GRID
 
 
 def find_best_placement_full(
@@ -11,7 +11,7 @@ def find_best_placement_full(
     budget: float,
     eager: bool = True,
 ) -> Tuple[int | None, int | None, float | None]:
-    H, W = grid_color.shape
+    H, W = GRID.shape
     h, w = image_color.shape
     if h > H or w > W:
         return None, None, None
@@ -24,9 +24,9 @@ def find_best_placement_full(
     for y in range(0, H - h + 1):
         for x in range(0, W - w + 1):
             # Extract the subregions from the grid.
-            region_color = grid_color[y : y + h, x : x + w]
-            region_owner = grid_owner[y : y + h, x : x + w]
-            region_stake = grid_stake[y : y + h, x : x + w]
+            region_color = GRID.color[y : y + h, x : x + w]
+            region_owner = GRID.owner[y : y + h, x : x + w]
+            region_stake = GRID.stake[y : y + h, x : x + w]
 
             # Compute the cost over active pixels:
             # For each pixel, if the grid cell does not match the image pixel,
@@ -54,15 +54,15 @@ def find_best_placement_sliding(
     budget: float,
     eager: bool = True,
 ) -> Tuple[int | None, int | None, float | None]:
-    H, W = grid_color.shape
+    H, W = GRID.shape
     h, w = image_color.shape
     if h > H or w > W:
         return None, None, None
 
     def partial_cost(y_slc, x_slc, img_slice, mask_slice):
-        gc = grid_color[y_slc, x_slc]
-        go = grid_owner[y_slc, x_slc]
-        gs = grid_stake[y_slc, x_slc]
+        gc = GRID.color[y_slc, x_slc]
+        go = GRID.owner[y_slc, x_slc]
+        gs = GRID.stake[y_slc, x_slc]
         base_mask = (gc != img_slice) & (go != new_owner)
         mask = base_mask & mask_slice
         return np.sum(gs[mask])
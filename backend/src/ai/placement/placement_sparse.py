@@ -0,0 +1,145 @@
+from typing import Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_cost_map import (
+    NBR_COST_TERMS,
+    combine_cost_terms,
+    cost_term_planes,
+    select_best_placement,
+)
+
+# upper bound on the number of gathered elements held in memory per chunk
+MAX_CHUNK_ELEMENTS = 1 << 20
+
+
+def _window_sums(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    planes: np.ndarray,
+    offset_rows: np.ndarray,
+    offset_cols: np.ndarray,
+    *,
+    grid: GridState,
+    max_chunk_elements: int,
+) -> np.ndarray:
+    # sums of the (k, H, W) planes over the pixels of each window that do not
+    # match the image colour, shape (k, nbr_offsets)
+    W = grid.width
+    sums = np.zeros((len(planes), len(offset_rows)), dtype=np.float64)
+
+    rows, cols = np.nonzero(image_mask)
+    if len(rows) == 0:
+        return sums
+
+    # flat index of every active pixel relative to the window origin
+    pixel_offsets = rows * W + cols
+    pixel_colors = image_color[rows, cols]
+
+    flat_color = grid.color.ravel()
+    flat_planes = planes.reshape(len(planes), -1)
+
+    window_origins = np.asarray(offset_rows) * W + np.asarray(offset_cols)
+
+    chunk = max(1, max_chunk_elements // len(pixel_offsets))
+    for start in range(0, len(window_origins), chunk):
+        idx = window_origins[start : start + chunk, None] + pixel_offsets[None, :]
+        mismatch = flat_color[idx] != pixel_colors[None, :]
+        for k, flat_plane in enumerate(flat_planes):
+            sums[k, start : start + chunk] = np.sum(
+                np.where(mismatch, flat_plane[idx], 0.0), axis=1
+            )
+
+    return sums
+
+
+def compute_costs_at_offsets(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    offset_rows: np.ndarray,
+    offset_cols: np.ndarray,
+    *,
+    grid: GridState = GRID,
+    max_chunk_elements: int = MAX_CHUNK_ELEMENTS,
+    not_owned_stake: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Cost of the placements at the given (in bounds) offsets, computed by
+    gathering the grid only at the active pixels of the image. The work scales
+    with nbr_active_pixels instead of image_h * image_w. Callers pricing many
+    batches of offsets can pass the stake of the pixels not owned by
+    new_owner, computed once.
+    """
+    if not_owned_stake is None:
+        not_owned_stake = np.where(grid.owner != new_owner, grid.stake, 0.0)
+    return _window_sums(
+        image_color,
+        image_mask,
+        not_owned_stake[None],
+        offset_rows,
+        offset_cols,
+        grid=grid,
+        max_chunk_elements=max_chunk_elements,
+    )[0]
+
+
+def compute_cost_terms_sparse(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    *,
+    grid: GridState = GRID,
+    max_chunk_elements: int = MAX_CHUNK_ELEMENTS,
+) -> np.ndarray:
+    # window sums of the cost terms, shape (NBR_COST_TERMS, H - h + 1, W - w + 1)
+    H, W = grid.shape
+    h, w = image_color.shape
+    if h > H or w > W:
+        return np.empty((NBR_COST_TERMS, 0, 0), dtype=np.float64)
+
+    out_h, out_w = H - h + 1, W - w + 1
+    offset_rows, offset_cols = np.divmod(np.arange(out_h * out_w), out_w)
+    sums = _window_sums(
+        image_color,
+        image_mask,
+        cost_term_planes(grid, grid.owner != new_owner),
+        offset_rows,
+        offset_cols,
+        grid=grid,
+        max_chunk_elements=max_chunk_elements,
+    )
+    return sums.reshape(NBR_COST_TERMS, out_h, out_w)
+
+
+def compute_cost_map_sparse(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    *,
+    grid: GridState = GRID,
+    max_chunk_elements: int = MAX_CHUNK_ELEMENTS,
+) -> np.ndarray:
+    # cost of every placement offset, shape (H - h + 1, W - w + 1), the sums
+    # carry no FFT round-off
+    terms = compute_cost_terms_sparse(
+        image_color,
+        image_mask,
+        new_owner,
+        grid=grid,
+        max_chunk_elements=max_chunk_elements,
+    )
+    return combine_cost_terms(terms, 0.0)
+
+
+def find_best_placement_sparse(
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    new_owner: int,
+    budget: float,
+    eager: bool = True,
+) -> Tuple[int | None, int | None, float | None]:
+    cost_map = compute_cost_map_sparse(image_color, image_mask, new_owner)
+    if cost_map.size == 0:
+        return None, None, None
+    return select_best_placement(cost_map, budget, eager)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_churn import CHURN, ChurnHeatmap
+
+
+def neighbour_stake(owner: int, *, grid: GridState = GRID) -> np.ndarray:
+    # highest stake held by someone else among the 8 neighbours of every pixel
+    H, W = grid.shape
+    stake = np.where(grid.owner == owner, 0.0, grid.stake)
+    padded = np.zeros((H + 2, W + 2), dtype=np.float64)
+    padded[1:-1, 1:-1] = stake
+    highest = np.zeros((H, W), dtype=np.float64)
+    for dr in range(3):
+        for dc in range(3):
+            if dr != 1 or dc != 1:
+                np.maximum(highest, padded[dr : dr + H, dc : dc + W], out=highest)
+    return highest
+
+
+def pixel_risk(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    owner: int,
+    stakes: np.ndarray,
+    *,
+    grid: GridState = GRID,
+    churn: ChurnHeatmap = CHURN,
+) -> np.ndarray:
+    """
+    How likely each pixel is to be outbid, 1 for a quiet pixel: plus its
+    recent changes of owner (the churn heat decays with the time since the
+    last change) plus the share of the stake around it held by others.
+    """
+    neighbours = neighbour_stake(owner, grid=grid)[rows, cols]
+    pressure = neighbours / np.maximum(neighbours + stakes, 1e-18)
+    return 1.0 + churn.heatmap()[rows, cols] + pressure
+
+
+def water_fill(stakes: np.ndarray, risks: np.ndarray, budget: float) -> np.ndarray:
+    """
+    Extra stake per pixel, summing to budget, raising the stake per unit of
+    risk of the least protected pixels to a common level: extra_i =
+    max(level * risk_i - stake_i, 0).
+    """
+    if len(stakes) == 0 or budget <= 0:
+        return np.zeros(len(stakes), dtype=np.float64)
+    protection = stakes / risks
+    order = np.argsort(protection, kind="stable")
+    # level reached when the budget fills the k + 1 least protected pixels,
+    # the pixels under water are the longest prefix below its level
+    levels = (budget + np.cumsum(stakes[order])) / np.cumsum(risks[order])
+    k = int(np.flatnonzero(levels >= protection[order])[-1])
+    return np.maximum(levels[k] * risks - stakes, 0.0)
@@ -0,0 +1,125 @@
+from typing import NamedTuple, Tuple
+import numpy as np
+
+from src.ai.placement.grid_state import GRID, GridState
+from src.ai.placement.placement_batch import find_best_placements_batch
+
+
+class ImageVariant(NamedTuple):
+    name: str
+    image_color: np.ndarray
+    image_mask: np.ndarray
+
+
+def transform_image(
+    name: str, image_color: np.ndarray, image_mask: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Supported transforms: flip_h (mirror left-right), flip_v, rot180, crop
+    (trim the transparent border), scaleN (upscale by the integer N) and
+    shrinkN (keep one pixel out of N in both directions).
+    """
+    if name == "flip_h":
+        return image_color[:, ::-1], image_mask[:, ::-1]
+    if name == "flip_v":
+        return image_color[::-1], image_mask[::-1]
+    if name == "rot180":
+        return image_color[::-1, ::-1], image_mask[::-1, ::-1]
+    if name == "crop":
+        rows, cols = np.nonzero(image_mask)
+        if len(rows) == 0:
+            return image_color, image_mask
+        window = slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1)
+        return image_color[window], image_mask[window]
+    if name.startswith("scale"):
+        factor = int(name[len("scale") :])
+        return (
+            np.repeat(np.repeat(image_color, factor, axis=0), factor, axis=1),
+            np.repeat(np.repeat(image_mask, factor, axis=0), factor, axis=1),
+        )
+    if name.startswith("shrink"):
+        factor = int(name[len("shrink") :])
+        return image_color[::factor, ::factor], image_mask[::factor, ::factor]
+    raise ValueError(f"Unknown image transform {name}")
+
+
+PROJECT_VARIANTS: dict[str, Tuple[Tuple[str, ...], list[ImageVariant]]] = {}
+
+
+def get_project_variants(
+    project_address: str,
+    image_color: np.ndarray,
+    image_mask: np.ndarray,
+    transforms: list[str],
+) -> list[ImageVariant]:
+    # variants are built once per project and set of transforms
+    cached = PROJECT_VARIANTS.get(project_address)
+    if cached is not None and cached[0] == tuple(transforms):
+        return cached[1]
+    variants = []
+    for name in transforms:
+        variant_color, variant_mask = transform_image(name, image_color, image_mask)
+        variants.append(
+            ImageVariant(
+                name,
+                np.ascontiguousarray(variant_color),
+                np.ascontiguousarray(variant_mask),
+            )
+        )
+    PROJECT_VARIANTS[project_address] = (tuple(transforms), variants)
+    return variants
+
+
+# name of the variant each project was last placed with, absent for the
+# original image
+PLACED_VARIANTS: dict[str, str] = {}
+
+
+def set_placed_image(project_address: str, image_color: np.ndarray):
+    # records which of the project variants, if any, image_color is
+    cached = PROJECT_VARIANTS.get(project_address)
+    variants = [] if cached is None else cached[1]
+    for variant in variants:
+        if variant.image_color is image_color:
+            PLACED_VARIANTS[project_address] = variant.name
+            return
+    PLACED_VARIANTS.pop(project_address, None)
+
+
+def get_placed_variant(
+    project_address: str, variants: list[ImageVariant]
+) -> ImageVariant | None:
+    name = PLACED_VARIANTS.get(project_address)
+    for variant in variants:
+        if variant.name == name:
+            return variant
+    return None
+
+
+def find_best_variant(
+    variants: list[ImageVariant],
+    new_owner: int,
+    budget: float,
+    *,
+    grid: GridState = GRID,
+) -> Tuple[ImageVariant | None, int | None, int | None, float | None]:
+    """
+    Cheapest affordable placement over all the variants. Their cost maps are
+    computed in one batched pass, variants of the same shape (e.g. flips)
+    sharing their transforms, and each best offset is re-priced exactly.
+    Only reads grid, a pinned view can be searched in a thread.
+    """
+    results = find_best_placements_batch(
+        [(variant.image_color, variant.image_mask, new_owner) for variant in variants],
+        [budget] * len(variants),
+        eager=False,
+        grid=grid,
+    )
+    best_variant: ImageVariant | None = None
+    best_row: int | None = None
+    best_col: int | None = None
+    best_cost: float | None = None
+    for variant, (row, col, cost) in zip(variants, results):
+        if cost is not None and (best_cost is None or cost < best_cost):
+            best_variant, best_row, best_col, best_cost = variant, row, col, cost
+    return best_variant, best_row, best_col, best_cost
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.ai.placement.grid_state import GRID
+from src.ai.placement.placement_incremental import PROJECT_COST_MAPS
+
+NBR_COLORS = 6
+NBR_OWNERS = 4
+
+
+def random_change(rng: np.random.Generator, staked: float = 0.5):
+    # one pixel set to a random colour, owner and stake, or no stake
+    row, col = rng.integers(0, GRID.shape[0]), rng.integers(0, GRID.shape[1])
+    stake_wei = int(rng.random() * 1e19) if rng.random() < staked else 0
+    GRID.set_pixel(
+        int(row),
+        int(col),
+        int(rng.integers(1, NBR_COLORS + 1)),
+        int(rng.integers(0, NBR_OWNERS)),
+        stake_wei,
+    )
+
+
+def random_image(rng: np.random.Generator, max_size: int = 12):
+    h, w = rng.integers(2, max_size, 2)
+    colors = rng.integers(1, NBR_COLORS + 1, (h, w))
+    image_color = GRID.intern_colors(colors.ravel()).reshape(h, w)
+    image_mask = rng.random((h, w)) < 0.8
+    return image_color, image_mask, int(rng.integers(0, NBR_OWNERS))
+
+
+@pytest.fixture(params=[0.1, 0.5, 1.0], ids=lambda p: f"staked{p}")
+def grid(request):
+    # the shared GRID filled pixel by pixel, the listeners see every change
+    rng = np.random.default_rng(7)
+    PROJECT_COST_MAPS.clear()
+    H, W = GRID.shape
+    for row in range(H):
+        for col in range(W):
+            stake_wei = int(rng.random() * 1e19) if rng.random() < request.param else 0
+            GRID.set_pixel(
+                row,
+                col,
+                int(rng.integers(1, NBR_COLORS + 1)),
+                int(rng.integers(0, NBR_OWNERS)),
+                stake_wei,
+            )
+    yield GRID
+    PROJECT_COST_MAPS.clear()
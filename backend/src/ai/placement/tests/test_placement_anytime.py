@@ -0,0 +1,22 @@
+import numpy as np
+
+from src.ai.placement.placement_anytime import offsets_by_distance
+
+
+def test_offsets_by_distance_matches_argsort():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        out_h, out_w = (int(n) for n in rng.integers(1, 30, 2))
+        hint = (int(rng.integers(-3, out_h + 3)), int(rng.integers(-3, out_w + 3)))
+        chunk = int(rng.integers(1, 50))
+        chunks = list(offsets_by_distance(out_h, out_w, hint, chunk))
+        assert all(len(rows) <= chunk for rows, _ in chunks)
+
+        # all the offsets in order of distance to the clamped hint, row-major
+        # among equals
+        row, col = min(max(hint[0], 0), out_h - 1), min(max(hint[1], 0), out_w - 1)
+        rows, cols = np.divmod(np.arange(out_h * out_w), out_w)
+        distance = np.maximum(np.abs(rows - row), np.abs(cols - col))
+        order = np.argsort(distance, kind="stable")
+        assert np.array_equal(np.concatenate([r for r, _ in chunks]), rows[order])
+        assert np.array_equal(np.concatenate([c for _, c in chunks]), cols[order])
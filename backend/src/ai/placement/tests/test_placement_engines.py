@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.ai.placement.placement_batch import find_best_placements_batch
+from src.ai.placement.placement_cost_map import (
+    exact_placement_cost,
+    select_repriced_placement,
+)
+from src.ai.placement.placement_fft import find_best_placement_fft
+from src.ai.placement.placement_incremental import create_project_cost_maps
+from src.ai.placement.placement_sliding import find_best_placement_full
+from src.ai.placement.placement_sparse import find_best_placement_sparse
+from src.ai.placement.tests.conftest import random_change, random_image
+
+
+def test_engines_match_full_search(grid):
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        image_color, image_mask, owner = random_image(rng)
+        budget = float(rng.random() * 5)
+        expected = find_best_placement_full(
+            image_color, image_mask, owner, budget, eager=False
+        )
+        for found in (
+            find_best_placement_fft(
+                image_color, image_mask, owner, budget, eager=False
+            ),
+            find_best_placement_sparse(
+                image_color, image_mask, owner, budget, eager=False
+            ),
+            find_best_placements_batch(
+                [(image_color, image_mask, owner)], [budget], eager=False
+            )[0],
+        ):
+            assert found[:2] == expected[:2]
+
+
+def test_patched_cost_maps_match_full_search(grid):
+    rng = np.random.default_rng(2)
+    projects = [(str(i),) + random_image(rng) for i in range(8)]
+    project_cost_maps = create_project_cost_maps(projects)
+    for step in range(300):
+        random_change(rng)
+        if step % 100 != 99:
+            continue
+        for project_cost_map in project_cost_maps:
+            image_color = project_cost_map.image_color
+            image_mask = project_cost_map.image_mask
+            owner = project_cost_map.new_owner
+            budget = float(rng.random() * 5)
+            expected = find_best_placement_full(
+                image_color, image_mask, owner, budget, eager=False
+            )
+            found = select_repriced_placement(
+                project_cost_map.cost_map,
+                budget,
+                False,
+                lambda row, col: exact_placement_cost(
+                    image_color, image_mask, owner, row, col
+                ),
+            )
+            assert found[:2] == expected[:2]
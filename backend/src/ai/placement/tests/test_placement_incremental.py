@@ -0,0 +1,62 @@
+import asyncio
+import numpy as np
+
+import src.ai.placement.placement_incremental as placement_incremental
+from src.ai.placement.placement_engine import compute_cost_terms
+from src.ai.placement.placement_incremental import (
+    PROJECT_COST_MAPS,
+    IncrementalCostMap,
+    rebuild_project_cost_maps_offloaded,
+)
+from src.ai.placement.placement_pool import shutdown_placement_pool
+from src.ai.placement.tests.conftest import random_change, random_image
+
+
+def assert_current(project_cost_map: IncrementalCostMap):
+    # counts exactly, stakes up to the round-off of the patches
+    terms = compute_cost_terms(
+        project_cost_map.image_color,
+        project_cost_map.image_mask,
+        project_cost_map.new_owner,
+    )
+    assert np.array_equal(np.rint(terms[1:]), np.rint(project_cost_map.terms[1:]))
+    assert np.allclose(terms[0], project_cost_map.terms[0], atol=1e-9)
+
+
+def test_install_replays_changes_past_rebuild_every(grid, monkeypatch):
+    monkeypatch.setattr(placement_incremental, "REBUILD_EVERY", 5)
+    rng = np.random.default_rng(3)
+    image_color, image_mask, owner = random_image(rng)
+    project_cost_map = IncrementalCostMap(image_color, image_mask, owner, pending=True)
+    PROJECT_COST_MAPS["0x1"] = project_cost_map
+    terms = compute_cost_terms(image_color, image_mask, owner)
+    for _ in range(40):
+        random_change(rng)
+    project_cost_map.install(terms)
+    assert_current(project_cost_map)
+    assert project_cost_map.stale
+
+
+def test_offloaded_rebuild_catches_up(grid, monkeypatch):
+    monkeypatch.setattr(placement_incremental, "REBUILD_EVERY", 5)
+    rng = np.random.default_rng(4)
+    project_cost_map = IncrementalCostMap(*random_image(rng))
+    PROJECT_COST_MAPS["0x1"] = project_cost_map
+    for _ in range(40):
+        random_change(rng)
+    assert project_cost_map.stale
+
+    async def rebuild_during_changes():
+        rebuild = asyncio.create_task(rebuild_project_cost_maps_offloaded())
+        await asyncio.sleep(0)
+        for _ in range(30):
+            random_change(rng)
+        await rebuild
+
+    try:
+        asyncio.run(rebuild_during_changes())
+    finally:
+        shutdown_placement_pool()
+    assert_current(project_cost_map)
+    assert project_cost_map.pending_changes is None
+    assert project_cost_map.nbr_patches == 30
@@ -1,8 +1,56 @@
 import numpy as np
-import hashlib
 
 max_uint32 = np.iinfo(np.uint32).max
 
+ZERO_ADDRESS = "0x" + "0" * 40
 
-def hash_address(address: str) -> int:
-    return int(hashlib.sha256(address.encode()).hexdigest(), 16) % max_uint32
+
+class OwnerTable:
+    """
+    Dense id of every owner address seen, and the address of every id, so
+    that the grid compares owners as uint32 without collisions. The id 0 is
+    the zero address, i.e. no owner. Addresses are lower-cased, every other
+    spelling seen (e.g. checksummed) is kept as an alias so that it is looked
+    up without lower-casing again.
+    """
+
+    def __init__(self):
+        self.ids: dict[str, int] = {ZERO_ADDRESS: 0}
+        self.addresses: list[str | None] = [ZERO_ADDRESS]
+        # ids not persisted yet
+        self.unsaved: list[int] = []
+
+    def intern(self, address: str) -> int:
+        id = self.ids.get(address)
+        if id is not None:
+            return id
+        lower = address.lower()
+        id = self.ids.get(lower)
+        if id is None:
+            id = len(self.addresses)
+            if id > max_uint32:
+                raise OverflowError("Too many owners for uint32 ids")
+            self.ids[lower] = id
+            self.addresses.append(lower)
+            self.unsaved.append(id)
+        self.ids[address] = id
+        return id
+
+    def address(self, id: int) -> str | None:
+        return self.addresses[id] if 0 <= id < len(self.addresses) else None
+
+    def load(self, entries: list[tuple[int, str]]):
+        # restores persisted (id, address) pairs, to be done before any intern
+        for id, address in entries:
+            address = address.lower()
+            if id >= len(self.addresses):
+                self.addresses.extend([None] * (id + 1 - len(self.addresses)))
+            self.addresses[id] = address
+            self.ids[address] = id
+
+
+OWNERS = OwnerTable()
+
+
+def owner_id(address: str) -> int:
+    return OWNERS.intern(address)
@@ -12,7 +12,9 @@ from src.models.pixamut.pixel_event.pixel_event_crud import (
 )
 from src.api.deps import get_db
 from src.models.pixamut.pixel.pixel_crud import PIXELS, PixelCreate
-from src.ai.placement.init import update_grid
+from src.ai.placement.init import save_owners, stage_grid_update
+from src.ai.placement.grid_state import GRID
+from src.ai.placement.placement_churn import CHURN
 from src.models.pixamut.project.project_crud import PROJECTS
 
 from .provider import pixel_staking_contract, provider
@@ -32,7 +34,10 @@ async def propagate_pixel_event(dbEvent: PixelEventCreate, db: AsyncSession):
         db,
         obj_in=pixel,
     )
-    update_grid(pixel)
+    # the events of a block share its timestamp, the previous block is
+    # published already
+    CHURN.advance(dbEvent.timestamp.replace(tzinfo=timezone.utc).timestamp())
+    stage_grid_update(pixel)
 
 
 async def parse_pixel_staked_event(event: Any, db: AsyncSession):
@@ -182,7 +187,12 @@ async def parse_pixels_color_changed_event(event: Any, db: AsyncSession):
 async def parse_pixel_events(events: list[Any], db) -> str | None:
     if len(events) > 0:
         events.sort(key=lambda e: (e["blockNumber"], e["logIndex"]))
+        block_number = None
         for event in events:
+            # readers see the grid one whole block at a time
+            if event["blockNumber"] != block_number:
+                GRID.publish()
+                block_number = event["blockNumber"]
             if event["event"] == "PixelStaked":
                 await parse_pixel_staked_event(event, db)
             elif event["event"] == "PixelsStaked":
@@ -195,6 +205,8 @@ async def parse_pixel_events(events: list[Any], db) -> str | None:
                 await parse_pixel_color_changed_event(event, db)
             elif event["event"] == "PixelsColorChanged":
                 await parse_pixels_color_changed_event(event, db)
+        GRID.publish()
+        await save_owners(db)
         latest = events[-1]
         latest_block = latest["blockNumber"] + 1
         await KEYVALUE.set(
@@ -15,7 +15,7 @@ from src.models.pixamut.project_event.project_event_crud import (
 from src.ai.image.image_processing import image_to_np
 from src.ai.placement.placement_sliding import find_best_placement_sliding
 from src.ai.placement.placement_actions import generate_actions_for_placement
-from src.ai.utils import hash_address
+from src.ai.utils import owner_id
 from src.models.pixamut.action.action_crud import ACTIONS
 
 from .provider import factory_contract, provider
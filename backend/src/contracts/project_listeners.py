@@ -1,11 +1,37 @@
+from typing import Tuple
 import numpy as np
 import asyncio
+import time
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from web3.types import TxParams
 from src.ai.image.image_processing import image_to_np
-from src.ai.utils import hash_address
-from src.ai.placement.placement_sliding import find_best_placement_full
+from src.ai.utils import owner_id
+from src.ai.placement.placement_incremental import (
+    get_project_cost_map,
+    create_project_cost_maps_offloaded,
+    rebuild_project_cost_maps_offloaded,
+)
 from src.ai.placement.placement_actions import generate_actions_for_placement
+from src.ai.placement.placement_anytime import find_best_placement_anytime
+from src.ai.placement.placement_engine import (
+    PlacementEngine,
+    choose_placement_engine,
+)
+from src.ai.placement.placement_pyramid import find_best_placement_pyramid
+from src.ai.placement.placement_hysteresis import kept_placement_cost
+from src.ai.placement.placement_variants import (
+    find_best_variant,
+    get_placed_variant,
+    get_project_variants,
+    set_placed_image,
+)
+from src.ai.placement.placement_cache import (
+    Placement,
+    cache_placements,
+    get_cached_placements,
+)
+from src.ai.placement.placement_joint import assign_joint_placements
+from src.ai.placement.grid_state import GRID
 from src.models.session import async_session
 from src.models.pixamut.action.action_crud import (
     ACTIONS,
@@ -20,13 +46,13 @@ from src.models.pixamut.project_snapshot.project_snapshot_crud import (
     PROJECT_SNAPSHOTS,
     ProjectSnapshotCreate,
 )
-from src.models.pixamut.pixel.pixel_crud import PIXELS
+from src.core.config import config
 from .provider import provider, account, token_contract
 
 
 async def run_transaction(
     db: AsyncSession, action: ActionCreate, project: ProjectModel, transaction: TxParams
-):
+) -> bool:
     try:
         gas_estimate: int = -1
         gas_price = transaction["gasPrice"] if "gasPrice" in transaction else 0
@@ -41,7 +67,7 @@ async def run_transaction(
             # action.hash = "failed"
             # db.add(action)
             # await db.commit()
-            pass
+            return False
         else:
             signed_txn = account.sign_transaction(transaction)
             tx_hash = await provider.eth.send_raw_transaction(
@@ -57,14 +83,18 @@ async def run_transaction(
             db.add(project)
             await db.refresh(project)
             await db.commit()
+            return tx_receipt["status"] == 1
     except Exception as e:
         print("error with transaction", e, flush=True)
         # action.hash = "failed"
         # db.add(action)
         # await db.commit()
+        return False
 
 
-async def run_action(db: AsyncSession, action: ActionCreate, project: ProjectModel):
+async def run_action(
+    db: AsyncSession, action: ActionCreate, project: ProjectModel
+) -> bool:
     project_contract = await get_project_contract(action.address)
     call = action.call
     print(call)
@@ -93,9 +123,231 @@ async def run_action(db: AsyncSession, action: ActionCreate, project: ProjectMod
             ).build_transaction(build_params)
 
         if transaction is not None:
-            await run_transaction(db, action, project, transaction)
+            return await run_transaction(db, action, project, transaction)
     except Exception as e:
         print("error building transaction", e, flush=True)
+    return False
+
+
+async def prepare_project_cost_maps(projects: list[ProjectModel]):
+    # cost maps of new projects are built together so the grid-wide
+    # intermediates are computed once per sweep
+    new_projects = []
+    for project in projects:
+        if get_project_cost_map(project.address) is not None:
+            continue
+        try:
+            image_grid, image_mask = image_to_np(project.image)
+            # image_grid = np.frombuffer(
+            #     project.image_grid, dtype=np.uint32
+            # ).reshape(project.image_h, project.image_w)
+            # image_mask = np.frombuffer(
+            #     project.image_mask, dtype=np.bool_
+            # ).reshape(project.image_h, project.image_w)
+            # image_mask = image_mask.astype(bool)
+        except Exception as e:
+            print("Error decoding project image:", str(e), flush=True)
+            continue
+        new_projects.append(
+            (
+                project.address,
+                GRID.intern_colors(image_grid),
+                image_mask,
+                owner_id(project.address),
+            )
+        )
+    if len(new_projects) > 0:
+        try:
+            await create_project_cost_maps_offloaded(new_projects)
+        except Exception as e:
+            print("Error computing project cost maps:", repr(e), flush=True)
+    try:
+        await rebuild_project_cost_maps_offloaded()
+    except Exception as e:
+        print("Error rebuilding project cost maps:", repr(e), flush=True)
+
+
+async def find_project_placements(
+    project: ProjectModel, budget_in_eth: float
+) -> list[Placement]:
+    # reuses the previous sweep while nothing changed under its placements
+    # and the project did not move since
+    cached = get_cached_placements(
+        project.address, budget_in_eth, (project.best_row, project.best_col)
+    )
+    if cached is not None:
+        return cached
+
+    project_cost_map = get_project_cost_map(project.address)
+    if project_cost_map is not None:
+        image_grid = project_cost_map.image_color
+        image_mask = project_cost_map.image_mask
+        print("Mask shape", image_mask.shape, flush=True)
+        # cheapest non-overlapping spots, the next one is used right away
+        # if the previous one got contested. This runs inline: an argmin over
+        # the maintained map, plus one FFT of the grid with a churn weight
+        candidates = project_cost_map.find_top_placements(
+            budget=budget_in_eth,
+            k=config.PLACEMENT_CANDIDATES,
+            non_overlapping=True,
+            position_weight=config.PLACEMENT_POSITION_WEIGHT,
+            churn_weight=config.PLACEMENT_CHURN_WEIGHT,
+        )
+    else:
+        # cost map not built yet (see prepare_project_cost_maps), search
+        # from the last best spot for a bounded time, in a thread on a pinned
+        # grid so that the events keep being processed
+        print("no cost map yet", project.address, flush=True)
+        image_grid, image_mask = image_to_np(project.image)
+        image_grid = GRID.intern_colors(image_grid)
+        if (
+            choose_placement_engine(image_grid, image_mask, cost_map=False)
+            == PlacementEngine.pyramid
+        ):
+            # large canvas, coarse to fine instead
+            best_row, best_col, best_cost = await asyncio.to_thread(
+                find_best_placement_pyramid,
+                image_grid,
+                image_mask,
+                owner_id(project.address),
+                budget_in_eth,
+                grid=GRID.pin(),
+            )
+        else:
+            best_row, best_col, best_cost = await asyncio.to_thread(
+                find_best_placement_anytime,
+                image_grid,
+                image_mask,
+                owner_id(project.address),
+                budget_in_eth,
+                deadline=time.monotonic() + config.PLACEMENT_SEARCH_TIMEOUT,
+                hint=(project.best_row, project.best_col),
+                grid=GRID.pin(),
+            )
+        candidates = [] if best_cost is None else [(best_row, best_col, best_cost)]
+    variants = (
+        get_project_variants(
+            project.address, image_grid, image_mask, config.PLACEMENT_VARIANTS
+        )
+        if len(config.PLACEMENT_VARIANTS) > 0
+        else []
+    )
+    # stay put unless moving saves enough, the current spot being priced with
+    # the variant it was taken with
+    current = (project.best_row, project.best_col)
+    current_variant = get_placed_variant(project.address, variants)
+    current_color, current_mask = (
+        (image_grid, image_mask)
+        if current_variant is None
+        else (current_variant.image_color, current_variant.image_mask)
+    )
+    current_cost = kept_placement_cost(
+        candidates,
+        current,
+        current_color,
+        current_mask,
+        owner_id(project.address),
+        budget_in_eth,
+        absolute_margin=config.PLACEMENT_STICKY_MARGIN,
+        relative_margin=config.PLACEMENT_STICKY_RATIO,
+    )
+    placements: list[Placement] = [
+        (row, col, cost, image_grid, image_mask)
+        for row, col, cost in candidates
+        if current_cost is None or (row, col) != current
+    ]
+    if current_cost is not None:
+        placements.insert(
+            0,
+            (
+                project.best_row,
+                project.best_col,
+                current_cost,
+                current_color,
+                current_mask,
+            ),
+        )
+    if len(variants) > 0:
+        # a transformed image may land somewhere cheaper, searched in a thread
+        # like the anytime search
+        variant, row, col, cost = await asyncio.to_thread(
+            find_best_variant,
+            variants,
+            owner_id(project.address),
+            budget_in_eth,
+            grid=GRID.pin(),
+        )
+        if variant is not None and cost is not None:
+            print("best variant", variant.name, row, col, cost, flush=True)
+            if (
+                len(placements) == 0
+                or cost + config.PLACEMENT_STICKY_MARGIN < placements[0][2]
+            ):
+                placements.insert(
+                    0, (row, col, cost, variant.image_color, variant.image_mask)
+                )
+    if (
+        len(placements) == 0
+        and project_cost_map is not None
+        and config.PLACEMENT_PARTIAL
+    ):
+        # nothing affordable as a whole, cover as much of the image as the
+        # budget allows, keeping the 1 token margin
+        row, col, partial_mask, cost = project_cost_map.find_partial_placement(
+            budget=budget_in_eth - 1.0
+        )
+        if partial_mask is not None:
+            print(
+                "partial placement",
+                int(partial_mask.sum()),
+                "of",
+                project.nbr_active_pixels,
+                flush=True,
+            )
+            placements.append((row, col, cost, image_grid, partial_mask))
+    cache_placements(
+        project.address,
+        budget_in_eth,
+        (project.best_row, project.best_col),
+        placements,
+    )
+    return placements
+
+
+async def get_project_budget(project: ProjectModel) -> float:
+    real_balance = await token_contract.functions.balanceOf(
+        provider.to_checksum_address(project.address)
+    ).call()  # type: ignore
+    return wei_to_ether(real_balance)
+
+
+async def find_joint_placements(
+    projects: list[ProjectModel],
+) -> dict[str, Tuple[float, list[Placement]]]:
+    # all the projects are run by the same account, they must not outbid
+    # each other. (budget, placements) of every project whose budget could be
+    # fetched, a project failing to be placed gets no placement
+    budgets: dict[str, float] = {}
+    project_placements: dict[int, list[Placement]] = {}
+    for project in projects:
+        try:
+            budget_in_eth = await get_project_budget(project)
+        except Exception as e:
+            print("Error fetching project budget:", repr(e), flush=True)
+            continue
+        budgets[project.address] = budget_in_eth
+        placements: list[Placement] = []
+        if budget_in_eth > 1:
+            try:
+                placements = await find_project_placements(project, budget_in_eth)
+            except Exception as e:
+                print("Error finding project placements:", repr(e), flush=True)
+        project_placements[owner_id(project.address)] = placements
+    assigned = assign_joint_placements(project_placements)
+    return {
+        address: (budget_in_eth, assigned[owner_id(address)])
+        for address, budget_in_eth in budgets.items()
+    }
 
 
 # lp tokens with zap functionnaly
@@ -109,6 +361,15 @@ async def project_execution_loop():
         async with async_session() as db:
             # 1 - get all projects
             projects = await PROJECTS.get_many(db, limit=10)
+            await prepare_project_cost_maps(projects)
+            joint_placements: dict[str, Tuple[float, list[Placement]]] | None = None
+            if config.PLACEMENT_JOINT:
+                try:
+                    joint_placements = await find_joint_placements(projects)
+                except Exception as e:
+                    # no project is placed this sweep rather than outbid another
+                    print("Error finding joint placements:", repr(e), flush=True)
+                    joint_placements = {}
             for project in projects:
                 try:
                     print("gas used", wei_to_ether(project.gas_used), flush=True)
@@ -121,8 +382,8 @@ async def project_execution_loop():
                             db, project_address=project.address
                         )
                         if dbProjectSnapshot is None:
-                            nbr_controlled_pixels = await PIXELS.get_owner_pixel_count(
-                                db, owner=project.address
+                            nbr_controlled_pixels = GRID.owner_pixel_count(
+                                owner_id(project.address)
                             )
                             dbProjectSnapshot = await PROJECT_SNAPSHOTS.create(
                                 db,
@@ -140,41 +401,34 @@ async def project_execution_loop():
                                 ),
                             )
                         balance_in_eth = wei_to_ether(project.balance)
-                        real_balance = await token_contract.functions.balanceOf(
-                            provider.to_checksum_address(project.address)
-                        ).call()  # type: ignore
-                        real_balance_in_eth = wei_to_ether(real_balance)
-                        budget_in_eth = real_balance_in_eth
+                        if joint_placements is not None:
+                            if project.address not in joint_placements:
+                                continue
+                            budget_in_eth, placements = joint_placements[
+                                project.address
+                            ]
+                        else:
+                            budget_in_eth = await get_project_budget(project)
 
                         if budget_in_eth <= 1:
                             print("not enough budget", budget_in_eth, flush=True)
                             continue
                         # 2 - find the best placement
-                        image_grid, image_mask = image_to_np(project.image)
-                        # image_grid = np.frombuffer(
-                        #     project.image_grid, dtype=np.uint32
-                        # ).reshape(project.image_h, project.image_w)
-                        # image_mask = np.frombuffer(
-                        #     project.image_mask, dtype=np.bool_
-                        # ).reshape(project.image_h, project.image_w)
-                        # image_mask = image_mask.astype(bool)
-
-                        print("Mask shape", image_mask.shape, flush=True)
-                        best_row, best_col, best_cost = find_best_placement_full(
-                            image_color=image_grid,
-                            image_mask=image_mask,
-                            new_owner=hash_address(project.address),
-                            budget=budget_in_eth,
-                            eager=False,
-                        )
-                        if (
-                            best_row is not None
-                            and best_col is not None
-                            and best_cost is not None
-                        ):
+                        if joint_placements is None:
+                            placements = await find_project_placements(
+                                project, budget_in_eth
+                            )
+                        for (
+                            best_row,
+                            best_col,
+                            best_cost,
+                            placement_color,
+                            placement_mask,
+                        ) in placements:
                             project.best_row = best_row
                             project.best_col = best_col
                             project.best_cost = int(best_cost * 1e18)
+                            set_placed_image(project.address, placement_color)
                             remaining_budget = budget_in_eth - best_cost
                             if remaining_budget > 1:
                                 remaining_budget -= 1.0
@@ -190,23 +444,45 @@ async def project_execution_loop():
                             )
                             db.add(project)
                             await db.commit()
+                            # the actions are built against the grid as of now,
+                            # whatever is published while they run
+                            grid = GRID.pin()
                             actions = generate_actions_for_placement(
-                                image_grid=image_grid,
-                                image_mask=image_mask,
+                                image_grid=placement_color,
+                                image_mask=placement_mask,
                                 nbr_active_pixels=project.nbr_active_pixels,
                                 base_row=best_row,
                                 base_col=best_col,
                                 project_address=project.address,
                                 unused_budget=remaining_budget,
+                                grid=grid,
                             )
                             # dbActions = await ACTIONS.setActions(
                             #     db, project_address=project.address, actions=actions
                             # )
 
-                            for dbAction in actions:
-                                await run_action(db, action=dbAction, project=project)
+                            contested = False
+                            for i, batch in enumerate(actions):
+                                executed = await run_action(
+                                    db,
+                                    action=batch.to_action(
+                                        project_address=project.address, idx=i
+                                    ),
+                                    project=project,
+                                )
+                                if not executed and i == 0:
+                                    contested = True
+                                    break
                                 # wait between tx
                                 # await asyncio.sleep(2)
+                            if contested:
+                                print(
+                                    "placement contested",
+                                    best_row,
+                                    best_col,
+                                    flush=True,
+                                )
+                                continue
 
                             # await asyncio.sleep(1)
                             if len(actions) > 0:
@@ -215,10 +491,8 @@ async def project_execution_loop():
                                     wei_to_ether(project.gas_used),
                                     flush=True,
                                 )
-                                nbr_controlled_pixels = (
-                                    await PIXELS.get_owner_pixel_count(
-                                        db, owner=project.address
-                                    )
+                                nbr_controlled_pixels = GRID.owner_pixel_count(
+                                    owner_id(project.address)
                                 )
                                 await PROJECT_SNAPSHOTS.create(
                                     db,
@@ -235,6 +509,7 @@ async def project_execution_loop():
                                         best_cost=project.best_cost,
                                     ),
                                 )
+                            break
 
                     else:
                         print(
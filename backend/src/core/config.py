@@ -1,5 +1,6 @@
 from typing import Any
 
+import re
 import secrets
 from pydantic import EmailStr, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings
@@ -105,6 +106,59 @@ class Settings(BaseSettings):
     ADMIN_PRIVATE_KEY: str = ""
     ADMIN_ADDRESS: str = ""
 
+    # must match the PixelStaking contract grid
+    GRID_H: int = 100
+    GRID_W: int = 100
+
+    PLACEMENT_POOL_SIZE: int = 2
+    PLACEMENT_TASK_TIMEOUT: float = 60.0
+    # threads computing cost maps, in the server and in each pool worker
+    PLACEMENT_THREADS: int = 1
+    PLACEMENT_CANDIDATES: int = 3
+    # place part of the image when no offset is affordable as a whole
+    PLACEMENT_PARTIAL: bool = True
+    # ether traded for the most central placement over the least central one
+    PLACEMENT_POSITION_WEIGHT: float = 0.0
+    # seconds spent searching a project placement without a cost map
+    PLACEMENT_SEARCH_TIMEOUT: float = 0.5
+    # ether, or fraction of the cost and stake at the current placement,
+    # another placement must save before a project moves
+    PLACEMENT_STICKY_MARGIN: float = 1.0
+    PLACEMENT_STICKY_RATIO: float = 0.1
+    # seconds a cached project placement is reused at most
+    PLACEMENT_CACHE_TTL: float = 60.0
+    # image transforms also tried, e.g. flip_h,flip_v,rot180,crop,scale2,shrink2
+    PLACEMENT_VARIANTS: list[str] | str = []
+    # ether added to a placement for every recent change of owner under it,
+    # recent changes counting half after PLACEMENT_CHURN_HALF_LIFE seconds
+    PLACEMENT_CHURN_WEIGHT: float = 0.0
+    PLACEMENT_CHURN_HALF_LIFE: float = 3600.0
+    # ether below which a pixel already held is not re-staked higher
+    PLACEMENT_TOPUP_MIN: float = 0.1
+    # place all the projects together so that they never outbid each other
+    PLACEMENT_JOINT: bool = False
+    # offsets past which a placement without cost map is searched coarse to
+    # fine (0 never), not exact, see find_best_placement_pyramid
+    PLACEMENT_PYRAMID_MIN_OFFSETS: int = 250_000
+    PLACEMENT_PYRAMID_LEVELS: int = 2
+    PLACEMENT_PYRAMID_CANDIDATES: int = 64
+
+    @field_validator("PLACEMENT_VARIANTS", mode="before")
+    @classmethod
+    def assemble_placement_variants(cls, v: str | list[str]) -> list[str]:
+        if isinstance(v, str):
+            v = [i.strip() for i in v.split(",") if len(i.strip()) > 0]
+        elif not isinstance(v, list):
+            raise ValueError(v)
+        # same names as transform_image, scale and shrink factors at least 1
+        for name in v:
+            match = re.fullmatch(r"(scale|shrink)([0-9]+)", name)
+            if name in ("flip_h", "flip_v", "rot180", "crop"):
+                continue
+            if match is None or int(match.group(2)) < 1:
+                raise ValueError(f"Unknown image transform {name}")
+        return v
+
     class Config:
         # env_file = str(Path(__file__).resolve().parent.parent.parent.parent / ".env")
         case_sensitive = True
@@ -16,6 +16,14 @@ class CRUDKeyValue(CRUDBase[KeyValueModel, KeyValue, KeyValue]):
         res = await db.execute(select(self.model).where(self.model.key == key))
         return res.scalar_one_or_none()
 
+    async def get_by_prefix(
+        self, db: AsyncSession, *, prefix: str
+    ) -> Sequence[KeyValueModel]:
+        res = await db.execute(
+            select(self.model).where(self.model.key.startswith(prefix, autoescape=True))
+        )
+        return res.scalars().all()
+
     async def set(self, db: AsyncSession, *, key: str, value: str) -> KeyValueModel:
         res = await self.create(db, obj_in=KeyValue(key=key, value=value))
         return res